@@ -0,0 +1,234 @@
+""" Локальний стенд інтернет-магазину НБУ для навантажувального тестування парсера.
+
+Режими:
+    # віддає записані сторінки з benchmarks/fixtures
+    python -m benchmarks.nbu_stub_server replay
+
+    # генерує синтетичний каталог: 10 000 товарів на 200 сторінках, з затримкою, помилками і змінами каталогу
+    python -m benchmarks.nbu_stub_server synthetic --products 10000 --pages 200 \\
+        --latency 80 --jitter 40 --error-rate 0.01 --mutation-rate 0.2
+
+    # записує поточні сторінки каталогу з сайту НБУ в benchmarks/fixtures
+    python -m benchmarks.nbu_stub_server record --source https://coins.bank.gov.ua/
+
+Щоб направити парсер на стенд, задайте NBU_SHOP_BASE_URL=http://127.0.0.1:8081/
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+_materials = ['Срібло', 'Золото', 'Нейзильбер', 'Біметал', 'Сплав на основі міді']
+_prices = [95, 150, 1250, 2440, 12500, 26300, 48200]
+
+
+class SyntheticCatalog:
+    """ Синтетичний каталог у розмітці сайту НБУ, який може змінюватись між запитами """
+
+    def __init__(self, products: int, pages: int, seed: int = 0):
+        self.random = random.Random(seed)
+        self.pages = pages
+        self.next_id = 100_000
+        # bank_product_id -> (name, price, in_stock)
+        self.products: dict[int, list] = {}
+        for _ in range(products):
+            self.add_product()
+
+    def add_product(self):
+        self.next_id += 1
+        self.products[self.next_id] = [f'Пам\'ятна монета №{self.next_id}', self.random.choice(_prices), True]
+
+    def mutate(self):
+        """ Випадкова зміна каталогу: новий товар, розпродаж, повернення в продаж або зміна ціни """
+        action = self.random.choice(['new', 'sold_out', 'restock', 'price'])
+        if action == 'new':
+            self.add_product()
+            return
+        product = self.products[self.random.choice(list(self.products))]
+        if action == 'sold_out':
+            product[2] = False
+        elif action == 'restock':
+            product[2] = True
+        else:
+            product[1] = self.random.choice(_prices)
+
+    def render_page(self, page: int) -> str:
+        ids = sorted(self.products, reverse=True)
+        per_page = max(1, -(-len(ids) // self.pages))
+        page_ids = ids[(page - 1) * per_page:page * per_page]
+        return render_catalog_page(
+            [(product_id, *self.products[product_id]) for product_id in page_ids],
+            page,
+            self.pages
+        )
+
+
+def render_catalog_page(products: list[tuple[int, str, int, bool]], page: int, pages: int) -> str:
+    items = []
+    for product_id, name, price, in_stock in products:
+        cart = f'<a href="#" class="btn add2cart" data-id="{product_id}" title="Купити">Купити</a>' \
+            if in_stock else '<span class="sold_out_label">Немає в наявності</span>'
+        price_text = f'{price:,}'.replace(',', ' ')
+        items.append(
+            f'<div class="col-lg-3 col-md-4 col-sm-6 product"><div class="product_inner">'
+            f'<a class="p_img_href" href="/moneta-{product_id}/p-{product_id}.html">'
+            f'<img class="lazy" src="/images/blank.gif" data-src="/media/images/products/{product_id}.jpg" alt=""></a>'
+            f'<a class="model_product" href="/moneta-{product_id}/p-{product_id}.html">{name}</a>'
+            f'<div class="product_prices"><span class="new_price">{price_text} грн</span></div>'
+            f'<div class="product_bank_parameters"><p>{_materials[product_id % len(_materials)]}</p>'
+            f'<p>{1000 * (product_id % 10 + 1)}</p><p>{2020 + product_id % 4}</p></div>'
+            f'<div class="basked_product_bank">{cart}</div></div></div>'
+        )
+    pagination = ''.join(f'<li><a href="catalog.html?page={number}">{number}</a></li>'
+                         for number in range(2, pages + 1) if number != page)
+    return f'<!DOCTYPE html><html lang="uk"><head><meta charset="utf-8"><title>Каталог</title></head><body>' \
+           f'<div class="container"><div id="block"><div class="row row_catalog_products">{"".join(items)}</div>' \
+           f'<ul class="pagination">{pagination}</ul></div></div></body></html>'
+
+
+class StubShop:
+
+    def __init__(self,
+                 catalog: SyntheticCatalog | None = None,
+                 fixtures_dir: Path = FIXTURES_DIR,
+                 latency: float = 0,
+                 jitter: float = 0,
+                 error_rate: float = 0,
+                 mutation_rate: float = 0):
+        self.catalog = catalog
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.mutation_rate = mutation_rate
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+        self._fixtures_index = {}
+        if catalog is None:
+            self._fixtures_index = json.loads((fixtures_dir / 'index.json').read_text(encoding='utf-8'))
+
+    def __page_html(self, request: web.Request) -> str | None:
+        if self.catalog is not None:
+            page = int(request.query.get('page', 1))
+            if not 1 <= page <= self.catalog.pages:
+                return
+            return self.catalog.render_page(page)
+
+        href = request.path_qs.lstrip('/')
+        file_name = self._fixtures_index.get(href)
+        if file_name is None:
+            return
+        return (self.fixtures_dir / file_name).read_text(encoding='utf-8')
+
+    async def catalog_handler(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=random.choice([500, 502, 503]))
+        if self.catalog is not None and random.random() < self.mutation_rate:
+            self.catalog.mutate()
+
+        page_html = self.__page_html(request)
+        if page_html is None:
+            raise web.HTTPNotFound()
+
+        etag = f'"{hashlib.sha1(page_html.encode("utf-8")).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=page_html, content_type='text/html', headers={'ETag': etag})
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+            'products': len(self.catalog.products) if self.catalog else None,
+        })
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/catalog.html', self.catalog_handler)
+        app.router.add_get('/_stats', self.stats_handler)
+        return app
+
+
+async def record(source: str, fixtures_dir: Path = FIXTURES_DIR):
+    """ Зберігає головну сторінку каталогу і всі сторінки пагінації разом з index.json """
+    source = source.rstrip('/') + '/'
+    # Імпорт тут, щоб replay і synthetic не залежали від налаштувань застосунку
+    from benchmarks.parser_bench import _setup_env
+    _setup_env()
+    from src.services.parser_backends import get_parser_backend
+
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    async with aiohttp.ClientSession() as session:
+        async def download(href: str) -> str:
+            async with session.get(f'{source}{href}') as response:
+                response.raise_for_status()
+                return await response.text()
+
+        main_page = await download('catalog.html')
+        parsed_page = get_parser_backend('lxml', source).parse_page(main_page, with_pagination=True)
+        hrefs = ['catalog.html'] + [url[len(source):] for url in parsed_page.pagination_urls]
+        pages = [main_page] + await asyncio.gather(*[download(href) for href in hrefs[1:]])
+
+    index = {}
+    for number, (href, page_html) in enumerate(zip(hrefs, pages), start=1):
+        file_name = f'catalog_page_{number}.html'
+        (fixtures_dir / file_name).write_text(page_html, encoding='utf-8')
+        index[href] = file_name
+    (fixtures_dir / 'index.json').write_text(json.dumps(index, indent=4) + '\n', encoding='utf-8')
+    print(f'Recorded {len(index)} pages to {fixtures_dir}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Local stand-in for the NBU coins shop')
+    subparsers = arg_parser.add_subparsers(dest='mode', required=True)
+
+    for mode in ('replay', 'synthetic'):
+        mode_parser = subparsers.add_parser(mode)
+        mode_parser.add_argument('--host', default='127.0.0.1')
+        mode_parser.add_argument('--port', type=int, default=8081)
+        mode_parser.add_argument('--latency', type=float, default=0, help='Mean response latency, ms')
+        mode_parser.add_argument('--jitter', type=float, default=0, help='Latency standard deviation, ms')
+        mode_parser.add_argument('--error-rate', type=float, default=0, help='Share of 5xx responses, 0..1')
+        if mode == 'replay':
+            mode_parser.add_argument('--fixtures', type=Path, default=FIXTURES_DIR)
+        else:
+            mode_parser.add_argument('--products', type=int, default=10_000)
+            mode_parser.add_argument('--pages', type=int, default=200)
+            mode_parser.add_argument('--mutation-rate', type=float, default=0,
+                                     help='Probability that a request changes the catalog, 0..1')
+            mode_parser.add_argument('--seed', type=int, default=0)
+
+    record_parser = subparsers.add_parser('record')
+    record_parser.add_argument('--source', default='https://coins.bank.gov.ua/')
+    record_parser.add_argument('--fixtures', type=Path, default=FIXTURES_DIR)
+
+    args = arg_parser.parse_args()
+    if args.mode == 'record':
+        asyncio.run(record(args.source, args.fixtures))
+        return
+
+    if args.mode == 'replay':
+        shop = StubShop(fixtures_dir=args.fixtures, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate)
+    else:
+        shop = StubShop(SyntheticCatalog(args.products, args.pages, args.seed), latency=args.latency,
+                        jitter=args.jitter, error_rate=args.error_rate, mutation_rate=args.mutation_rate)
+    web.run_app(shop.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+""" Офлайн бенчмарк парсера каталогу на записаних сторінках з benchmarks/fixtures.
+
+Запуск з кореня репозиторію:
+    python -m benchmarks.parser_bench --repeat 50
+
+Кожен кейс виконується в окремому процесі, щоб пікове споживання пам'яті (peak RSS) не змішувалось між кейсами.
+Парсинг іде через справжній ProductParser з пулом процесів розміром --pool-size (0 - в основному процесі).
+Peak RSS враховує лише основний процес кейсу, без процесів пулу.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+BASE_URL = 'https://coins.bank.gov.ua/'
+
+# Налаштування, без яких не імпортується src.config.settings. Для бенчмарку їх значення не важливі
+_BENCH_ENV = {
+    'DEVELOP': 'true',
+    'NBU_SHOP_BASE_URL': BASE_URL,
+    'BOT_API_TOKEN': '000000000:benchmark',
+    'WEBHOOK_BASE_URL': 'http://localhost',
+    'CHANNEL_ID': '0',
+    'DB_HOST': 'localhost',
+    'DB_COLLECTION': 'benchmark',
+    'DB_USER': 'benchmark',
+    'DB_PASSWORD': 'benchmark',
+    'WAY_FOR_PAY_API_URL': 'http://localhost',
+    'OWNER_SECRET_KEY': 'benchmark',
+    'MERCHANT_ACCOUNT': 'benchmark',
+    'MERCHANT_DOMAIN_NAME': 'localhost',
+    'SERVICE_URL': 'http://localhost',
+    'SERVICE_NAME': 'benchmark',
+    'SERVICE_PRICE': '1',
+    'FONDY_MERCHANT_ID': '0',
+    'FONDY_SECRET_KEY': 'benchmark',
+}
+
+
+def _setup_env():
+    for key, value in _BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    # Частина товарів у корпусі навмисно невалідна, помилки валідації тут лише заважають читати результати
+    from src.config.settings import logger
+    logger.setLevel(logging.CRITICAL)
+
+
+def load_corpus(fixtures_dir: Path = FIXTURES_DIR) -> list[tuple[str, str]]:
+    """ Повертає пари (url, html) у порядку індексу пагінації, головна сторінка першою """
+    index = json.loads((fixtures_dir / 'index.json').read_text(encoding='utf-8'))
+    return [(f'{BASE_URL}{href}', (fixtures_dir / file_name).read_text(encoding='utf-8'))
+            for href, file_name in index.items()]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss на Linux - в кілобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class FixtureFetcher:
+    """ Замість PageFetcher віддає сторінки корпусу, тож ProductParser працює без мережі.
+    Все, що вище завантаження (пул процесів, знімки сторінок, повторне використання товарів), - справжнє """
+
+    def __init__(self, pages: dict[str, str]):
+        self.pages = pages
+
+    async def fetch(self, url: str, headers: dict[str, str] | None = None):
+        from src.schemas.parser import FetchResponse
+
+        page_html = self.pages.get(url)
+        if page_html is None:
+            return FetchResponse.construct(url=url, status=404)
+        return FetchResponse.construct(url=url, status=200, text=page_html)
+
+
+def _make_parser(backend_name: str, corpus: list[tuple[str, str]]):
+    from src.config.settings import settings
+    from src.services.catalog_crawler import ProductParser
+    from src.services.parser_backends import get_parser_backend
+
+    parser = ProductParser(BASE_URL)
+    parser.backend = get_parser_backend(backend_name, parser.bank_base_url)
+    parser.fetcher = FixtureFetcher(dict(corpus))
+    if settings.parser_process_pool_size > 0:
+        # Той самий пул, що створює ProductParser, але процеси пулу теж не логують помилки валідації корпусу
+        parser._executor = ProcessPoolExecutor(max_workers=settings.parser_process_pool_size,
+                                               mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=_setup_env)
+    return parser
+
+
+async def _close(parser):
+    # Кейс виконується в процесі-воркері, тож пул парсера треба дочекатись, а не кидати, як при зупинці застосунку
+    if parser._executor is not None:
+        parser._executor.shutdown(wait=True)
+        parser._executor = None
+    await parser.close()
+
+
+def _stored_products(backend_name: str, corpus: list[tuple[str, str]]) -> list:
+    """ Каталог у базі: всі товари з корпусу, частина з них зі зміненою ціною або позначена як sold_out """
+    from src.schemas.mongo_collections import ProductOut
+    from src.services.parser_backends import extract_page
+
+    stored_products = []
+    for url, page_html in corpus:
+        _, records = extract_page(backend_name, BASE_URL, page_html)
+        for n, (_, record) in enumerate(records):
+            record = {**record, '_id': record['bank_product_id']}
+            if n % 10 == 0:
+                record['price'] += 1
+            if n % 15 == 0:
+                record['sold_out'] = True
+            stored_products.append(ProductOut.construct(**record))
+    return stored_products
+
+
+def _change_one_price(page_html: str, price: int) -> str:
+    # Змінює один товар на сторінці: хеш сторінки інший, решта HTML-фрагментів товарів - ті самі
+    return re.sub(r'new_price">[\d ]+ грн', f'new_price">{price} грн', page_html, count=1)
+
+
+async def _crawl(parser, stored_products: list) -> int:
+    """ Те саме, що parser_processing до запису в базу: обхід каталогу і порівняння з товарами в базі """
+    from src.services.catalog_diff import CatalogDiffer
+
+    differ = CatalogDiffer(stored_products)
+    products_count = 0
+    async for page in parser.iter_pages():
+        products_count += len(page.products)
+        if differ.add(page.products):
+            differ.resolve([])
+    differ.finish()
+    return products_count
+
+
+def bench_get_products_from_page(backend_name: str, repeat: int) -> dict:
+    """ ProductParser.get_products_from_page: парсинг сторінки в пулі процесів і збирання Product """
+    _setup_env()
+    corpus = load_corpus()
+    parser = _make_parser(backend_name, corpus)
+
+    async def run() -> tuple[int, float]:
+        # Пул процесів живе весь час роботи застосунку, тож його запуск не входить у вимір
+        await parser.get_products_from_page(corpus[0][1])
+        products_count = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for url, page_html in corpus:
+                products_count += len(await parser.get_products_from_page(page_html))
+        elapsed = time.perf_counter() - start
+        await _close(parser)
+        return products_count, elapsed
+
+    products_count, elapsed = asyncio.run(run())
+    return _result('get_products_from_page', backend_name, len(corpus) * repeat, products_count, elapsed)
+
+
+def bench_parser_processing(backend_name: str, repeat: int) -> dict:
+    """ Повний обхід ProductParser.iter_pages без знімків попереднього обходу і порівняння з каталогом у базі """
+    _setup_env()
+    corpus = load_corpus()
+    parser = _make_parser(backend_name, corpus)
+    stored_products = _stored_products(backend_name, corpus)
+
+    async def run() -> tuple[int, float]:
+        await parser.get_products_from_page(corpus[0][1])
+        products_count = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parser.page_snapshots = {}
+            products_count += await _crawl(parser, stored_products)
+        elapsed = time.perf_counter() - start
+        await _close(parser)
+        return products_count, elapsed
+
+    products_count, elapsed = asyncio.run(run())
+    return _result('parser_processing', backend_name, len(corpus) * repeat, products_count, elapsed)
+
+
+def bench_parser_processing_warm(backend_name: str, repeat: int) -> dict:
+    """ Повторний обхід, як між запусками планувальника: на кожній сторінці змінився один товар,
+    решта береться зі знімка попереднього обходу за хешем HTML-фрагмента """
+    _setup_env()
+    corpus = load_corpus()
+    parser = _make_parser(backend_name, corpus)
+    stored_products = _stored_products(backend_name, corpus)
+
+    async def run() -> tuple[int, float]:
+        await _crawl(parser, stored_products)
+        products_count = 0
+        elapsed = 0
+        for n in range(repeat):
+            parser.fetcher.pages = {url: _change_one_price(page_html, 1000 + n) for url, page_html in corpus}
+            start = time.perf_counter()
+            products_count += await _crawl(parser, stored_products)
+            elapsed += time.perf_counter() - start
+        await _close(parser)
+        return products_count, elapsed
+
+    products_count, elapsed = asyncio.run(run())
+    return _result('parser_processing_warm', backend_name, len(corpus) * repeat, products_count, elapsed)
+
+
+def compare_backends(backends: list[str]) -> dict[str, int]:
+    """ Перевіряє, що всі бекенди витягують з корпусу однакові товари. Повертає кількість товарів по бекендах """
+    _setup_env()
+    from src.services.parser_backends import extract_page
+
+    corpus = load_corpus()
+    extracted = {}
+    for backend_name in backends:
+        extracted[backend_name] = [
+            {key: value for key, value in record.items() if key not in ('created', 'available_from', 'updated')}
+            for url, page_html in corpus
+            for _, record in extract_page(backend_name, BASE_URL, page_html)[1]
+        ]
+
+    reference_name, reference = next(iter(extracted.items()))
+    for backend_name, records in extracted.items():
+        if records != reference:
+            raise AssertionError(f'Backend {backend_name} extracted different products than {reference_name}')
+    return {backend_name: len(records) for backend_name, records in extracted.items()}
+
+
+def _result(stage: str, backend_name: str, pages: int, products: int, elapsed: float) -> dict:
+    return {
+        'stage': stage,
+        'backend': backend_name,
+        'pages': pages,
+        'products': products,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 1),
+        'products_per_sec': round(products / elapsed, 1),
+        'us_per_product': round(elapsed / products * 1_000_000, 1) if products else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+BENCHMARKS = {
+    'get_products_from_page': bench_get_products_from_page,
+    'parser_processing': bench_parser_processing,
+    'parser_processing_warm': bench_parser_processing_warm,
+}
+
+
+def run(backends: list[str], stages: list[str], repeat: int) -> list[dict]:
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for stage in stages:
+        for backend_name in backends:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(BENCHMARKS[stage], backend_name, repeat).result())
+    return results
+
+
+def print_results(results: list[dict]):
+    columns = ['stage', 'backend', 'pages', 'products', 'seconds', 'pages_per_sec', 'products_per_sec',
+               'us_per_product', 'peak_rss_mb']
+    widths = {column: max(len(column), *(len(str(item[column])) for item in results)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for item in results:
+        print('  '.join(str(item[column]).ljust(widths[column]) for column in columns))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Offline ProductParser benchmark')
+    arg_parser.add_argument('--backend', action='append', choices=['html.parser', 'lxml'],
+                            help='Parser backend, can be repeated. Default: all backends')
+    arg_parser.add_argument('--stage', action='append', choices=list(BENCHMARKS),
+                            help='Benchmark stage, can be repeated. Default: all stages')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='How many times to parse the corpus')
+    arg_parser.add_argument('--pool-size', type=int, help='Parser process pool size. Default: from settings')
+    arg_parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = arg_parser.parse_args()
+
+    backends = args.backend or ['html.parser', 'lxml']
+    if args.pool_size is not None:
+        # Процеси кейсів успадковують оточення і читають налаштування вже з ним
+        os.environ['PARSER_PROCESS_POOL_SIZE'] = str(args.pool_size)
+    print(f'Products extracted from corpus: {compare_backends(backends)}')
+    results = run(backends, args.stage or list(BENCHMARKS), args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,9 @@ import datetime
 import time
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.webhook import SendMessage
 from aiogram.types import Message
-from aiogram.utils.exceptions import BotBlocked, RetryAfter
+from aiogram.utils.exceptions import BadRequest, BotBlocked, RetryAfter, TelegramAPIError
 from bson import ObjectId
 
 from src.config.settings import settings, logger
@@ -12,13 +13,18 @@ from src.crud.client import ClientCRUD
 from src.crud.invite import InviteCRUD
 from src.crud.payment import PaymentCRUD
 from src.crud.product import ProductCRUD
+from src.crud.product_event import ProductEventCRUD
+from src.schemas.bot import MessageModel
 from src.schemas.mongo_collections import ClientIn, PaymentIn, Product, Invite
+from src.services.broadcast import BroadcastLeaseError, broadcast
+from src.services.outbound_queue import outbound_queue
 from src.services.payment_controller import PaymentControllerV2
+from src.utils.enums import ChangeType, JobKind
 from src.utils.bot_helpers import get_start_message, get_payment_message, success_payment_and_invite_messages, \
     kick_user_from_channel_msg, find_product_message, get_join_command_message, get_info_command_message, \
     get_unknown_command_message, get_support_command_message, get_about_command_message, get_chat_join_request_message, \
-    report_notification_message
-from src.utils.helpers import client_has_active_sub
+    report_notification_message, find_products_album_message
+from src.utils.helpers import client_has_active_sub, get_client_subscription
 from src.utils.utils import generate_fondy_payment_params
 
 bot = Bot(settings.bot_api_token)
@@ -28,12 +34,7 @@ dp = Dispatcher(bot)
 @dp.message_handler(commands=['about'])
 async def about_command(message: Message):
     message_models = get_about_command_message()
-    for model in message_models:
-        try:
-            await message.answer(model.text, reply_markup=model.keyboard)
-            await asyncio.sleep(8)
-        except BotBlocked:
-            break
+    await schedule_messages(message.chat.id, message_models, interval=8)
 
 
 @dp.message_handler(commands=['start'])
@@ -48,23 +49,17 @@ async def start(message: Message):
         )
         client = await ClientCRUD.insert_one(new_client)
         logger.info(f'Add new client: {client}')
+    else:
+        # Клієнт, який розблокував бота, знову отримує розсилки
+        await ClientCRUD.set_bot_blocked([message.from_user.id], False)
     message_models = get_start_message(message)
-    for model in message_models:
-        try:
-            await message.answer(
-                text=model.text,
-                reply_markup=model.keyboard,
-                disable_web_page_preview=True,
-                parse_mode='HTML'
-            )
-        except BotBlocked:
-            break
-        await asyncio.sleep(8)
+    await schedule_messages(message.chat.id, message_models, interval=8, parse_mode='HTML',
+                            disable_web_page_preview=True)
 
 
 @dp.message_handler(commands=['payment'])
 async def create_payment(message: Message):
-    client = await ClientCRUD.get_one(chat_id=message.from_user.id)
+    client = await ClientCRUD.get_subscription(chat_id=message.from_user.id)
     order_id = str(ObjectId())
     payment_params = generate_fondy_payment_params(order_id)
     payment_url = PaymentControllerV2.create_invoice_url(payment_params)
@@ -85,9 +80,11 @@ async def create_payment(message: Message):
         logger.info(f'Inserted new payment {result}')
 
 
+# Обробники з однією відповіддю повертають SendMessage: вона віддається в тілі відповіді на webhook
+# без окремого запиту до Bot API, або відправляється воркером, якщо відповідь на webhook вже повернута
 @dp.message_handler(commands=['join'])
 async def join_command(message: Message):
-    client = await ClientCRUD.get_one(chat_id=message.from_user.id)
+    client = await get_client_subscription(message.from_user.id)
     has_subscribe = client_has_active_sub(client)
     if has_subscribe:
         invite_link = await get_or_create_invite_link()
@@ -95,31 +92,22 @@ async def join_command(message: Message):
     else:
         message_model = get_join_command_message(has_subscribe)
 
-    try:
-        await message.answer(text=message_model.text, reply_markup=message_model.keyboard)
-    except BotBlocked:
-        pass
+    return SendMessage(message.chat.id, message_model.text, reply_markup=message_model.keyboard)
 
 
 @dp.message_handler(commands=['info'])
 async def info_command(message: Message):
-    client = await ClientCRUD.get_one(chat_id=message.from_user.id)
+    client = await get_client_subscription(message.from_user.id)
     has_subscribe = client_has_active_sub(client)
     message_model = get_info_command_message(has_subscribe, client.expired_at)
 
-    try:
-        await message.answer(text=message_model.text, reply_markup=message_model.keyboard)
-    except BotBlocked:
-        pass
+    return SendMessage(message.chat.id, message_model.text, reply_markup=message_model.keyboard)
 
 
 @dp.message_handler(commands=['support'])
 async def support_command(message: Message):
     message_model = get_support_command_message()
-    try:
-        await message.answer(text=message_model.text, reply_markup=message_model.keyboard)
-    except BotBlocked:
-        pass
+    return SendMessage(message.chat.id, message_model.text, reply_markup=message_model.keyboard)
 
 
 @dp.chat_join_request_handler()
@@ -127,7 +115,8 @@ async def chat_join_approve_or_decline(update: types.ChatJoinRequest):
     """ Відслідковує запити на приєднання до каналу, якщо юзер сплатив підписку - підтверджує інвайт """
     logger.info(f'New chat join request: {update}')
     user_id = update['from']['id']
-    client = await ClientCRUD.get_one(chat_id=user_id)
+    # Запити на приєднання приходять хвилею після оплат, тому статус підписки береться з кешу
+    client = await get_client_subscription(user_id)
     has_subscribe = client_has_active_sub(client)
     try:
         if has_subscribe:
@@ -144,14 +133,11 @@ async def chat_join_approve_or_decline(update: types.ChatJoinRequest):
 @dp.message_handler()
 async def echo_message(message: Message):
     message_model = get_unknown_command_message()
-    try:
-        await message.answer(text=message_model.text)
-    except BotBlocked:
-        pass
+    return SendMessage(message.chat.id, message_model.text)
 
 
 async def send_approve_payment_msg(client_id: str, order_reference: str):
-    client = await ClientCRUD.get_one(id=client_id)
+    client = await ClientCRUD.get_subscription(id=client_id)
     if client:
         invite_link = await get_or_create_invite_link()
         message_models = success_payment_and_invite_messages(
@@ -159,16 +145,7 @@ async def send_approve_payment_msg(client_id: str, order_reference: str):
             client.expired_at,
             invite_link
         )
-        for model in message_models:
-            try:
-                await bot.send_message(
-                    chat_id=client.chat_id,
-                    text=model.text,
-                    reply_markup=model.keyboard
-                )
-            except BotBlocked:
-                break
-            await asyncio.sleep(3)
+        await schedule_messages(client.chat_id, message_models, interval=3)
 
 
 async def get_or_create_invite_link():
@@ -191,20 +168,204 @@ async def get_or_create_invite_link():
     return link_obj.invite_link
 
 
-async def send_find_product_message(chat_id: str, product: Product, is_new: bool = True):
-    message_model = find_product_message(product, is_new)
+async def schedule_messages(chat_id: int,
+                            message_models: list[MessageModel],
+                            interval: float,
+                            parse_mode: str | None = None,
+                            disable_web_page_preview: bool | None = None):
+    """ Передає послідовність повідомлень у чергу: перше відправляється одразу, наступні - з паузою interval.
+    Обробник не чекає на відправку, тож відповідь на webhook повертається без затримки """
+    if not message_models:
+        return
+    await outbound_queue.enqueue(JobKind.chat_message, {
+        'chat_id': chat_id,
+        'messages': [
+            {'text': model.text, 'keyboard': model.keyboard.to_python() if model.keyboard else None}
+            for model in message_models
+        ],
+        'interval': interval,
+        'parse_mode': parse_mode,
+        'disable_web_page_preview': disable_web_page_preview
+    })
+
 
+@outbound_queue.handler(JobKind.chat_message)
+async def chat_message_job(chat_id: int,
+                           messages: list[dict],
+                           interval: float,
+                           parse_mode: str | None = None,
+                           disable_web_page_preview: bool | None = None):
+    """ Відправляє перше повідомлення послідовності і лише після успіху ставить у чергу решту.
+    Повтор після помилки не дає наступним повідомленням обігнати поточне """
+    message = messages[0]
     try:
-        await bot.send_photo(
-            photo=product.image_url,
+        await bot.send_message(
             chat_id=chat_id,
-            caption=message_model.text,
-            reply_markup=message_model.keyboard,
-            parse_mode='HTML'
+            text=message['text'],
+            reply_markup=types.InlineKeyboardMarkup.to_object(message['keyboard']) if message['keyboard'] else None,
+            parse_mode=parse_mode,
+            disable_web_page_preview=disable_web_page_preview
         )
+    except BotBlocked:
+        # Решту послідовності відправляти нікому
+        await ClientCRUD.set_bot_blocked([chat_id])
+        return
+
+    if len(messages) > 1:
+        await outbound_queue.enqueue(JobKind.chat_message, {
+            'chat_id': chat_id,
+            'messages': messages[1:],
+            'interval': interval,
+            'parse_mode': parse_mode,
+            'disable_web_page_preview': disable_web_page_preview
+        }, delay=interval)
+
+
+@outbound_queue.handler(JobKind.approve_payment)
+async def approve_payment_job(client_id: str, order_reference: str):
+    await send_approve_payment_msg(client_id, order_reference)
+
+
+@outbound_queue.batch_handler(JobKind.product_alert, size=settings.alert_album_size, key='chat_id',
+                              window=settings.alert_coalesce_window)
+async def product_alert_job(payloads: list[dict]):
+    # Сплеск сповіщень в один чат відправляється альбомами, поодинокі товари - окремим фото
+    chat_id = payloads[0]['chat_id']
+    products = [Product(**payload['product']) for payload in payloads]
+    file_ids = await ProductCRUD.get_image_file_ids([product.bank_product_id for product in products])
+    for product in products:
+        product.image_file_id = file_ids.get(product.bank_product_id)
+
+    if len(products) == 1:
+        await send_find_product_message(chat_id, products[0], payloads[0]['is_new'])
+    else:
+        await send_find_products_album(chat_id, products, [payload['is_new'] for payload in payloads])
+
+
+@outbound_queue.handler(JobKind.image_preupload)
+async def image_preupload_job(bank_product_id: int, image_url: str):
+    """ Завантажує фото нового товару в службовий чат, щоб наступні сповіщення відправлялись за file_id """
+    if not settings.image_cache_chat_id:
+        return
+    if await ProductCRUD.get_image_file_ids([bank_product_id]):
+        return
+    message = await bot.send_photo(chat_id=settings.image_cache_chat_id, photo=image_url, disable_notification=True)
+    await ProductCRUD.set_image_file_ids({bank_product_id: message.photo[-1].file_id})
+    try:
+        await bot.delete_message(chat_id=settings.image_cache_chat_id, message_id=message.message_id)
+    except TelegramAPIError as e:
+        logger.warning(f'Failed to delete cached image message. Traceback: {e}')
+
+
+async def send_find_product_message(chat_id: str, product: Product, is_new: bool = True):
+    message_model = find_product_message(product, is_new)
+
+    try:
+        try:
+            message = await bot.send_photo(
+                photo=product.image_file_id or product.image_url,
+                chat_id=chat_id,
+                caption=message_model.text,
+                reply_markup=message_model.keyboard,
+                parse_mode='HTML'
+            )
+        except BadRequest as e:
+            if not product.image_file_id:
+                raise
+            # Закешований file_id більше не дійсний - відправляємо за посиланням і кешуємо новий
+            logger.warning(f'Cached image of product {product.bank_product_id} is invalid: {e}')
+            product.image_file_id = None
+            message = await bot.send_photo(
+                photo=product.image_url,
+                chat_id=chat_id,
+                caption=message_model.text,
+                reply_markup=message_model.keyboard,
+                parse_mode='HTML'
+            )
     except RetryAfter as e:
+        # Черга повторить відправку, коли мине timeout
         logger.error(f'Retry after error. Timeout: {e.timeout}')
-        await asyncio.sleep(e.timeout)
+        raise
+
+    if not product.image_file_id and message.photo:
+        await cache_image_file_ids({product.bank_product_id: message.photo[-1].file_id})
+
+
+async def cache_image_file_ids(file_ids: dict[int, str]):
+    # Повідомлення вже доставлене, тож помилка кешу не повинна призводити до повторної відправки задачі
+    try:
+        await ProductCRUD.set_image_file_ids(file_ids)
+    except Exception as e:
+        logger.error(f'Failed to cache image file_ids of products {list(file_ids)}. Traceback: {e}')
+
+
+async def send_find_products_album(chat_id: str, products: list[Product], is_new: list[bool]):
+    caption, links_message = find_products_album_message(products, is_new)
+
+    def build_media() -> types.MediaGroup:
+        media = types.MediaGroup()
+        for n, product in enumerate(products):
+            media.attach_photo(product.image_file_id or product.image_url, caption=caption if n == 0 else None,
+                               parse_mode='HTML')
+        return media
+
+    # Альбом - одна задача черги: якщо він не відправився, черга повторить його повністю
+    try:
+        messages = await bot.send_media_group(chat_id=chat_id, media=build_media())
+    except BadRequest as e:
+        cached_ids = [product.bank_product_id for product in products if product.image_file_id]
+        messages = None
+        if cached_ids:
+            # Якийсь з file_id недійсний, а який саме - Telegram не повідомляє. Відправляємо всі фото за посиланнями
+            logger.warning(f'Cached images of products {cached_ids} are invalid: {e}')
+            await ProductCRUD.unset_image_file_ids(cached_ids)
+            for product in products:
+                product.image_file_id = None
+            try:
+                messages = await bot.send_media_group(chat_id=chat_id, media=build_media())
+            except BadRequest as retry_error:
+                e = retry_error
+        if messages is None:
+            # Одне недоступне фото не повинно коштувати всього альбому - відправляємо товари окремо
+            logger.warning(f'Failed to send album of products {[product.bank_product_id for product in products]} '
+                           f'to chat {chat_id}: {e}. Send products one by one.')
+            await send_find_products_separately(chat_id, products, is_new)
+            return
+
+    await cache_image_file_ids({
+        product.bank_product_id: message.photo[-1].file_id
+        for product, message in zip(products, messages)
+        if not product.image_file_id and message.photo
+    })
+
+    # Альбом вже відправлено, тому помилка з посиланнями не повинна призводити до повтору всієї задачі
+    for _ in range(2):
+        try:
+            await bot.send_message(chat_id=chat_id, text=links_message.text, reply_markup=links_message.keyboard)
+            break
+        except RetryAfter as e:
+            await asyncio.sleep(e.timeout)
+        except Exception as e:
+            logger.error(f'Failed to send album links to chat {chat_id}. Traceback: {e}')
+            break
+
+
+async def send_find_products_separately(chat_id: str, products: list[Product], is_new: list[bool]):
+    for n, (product, product_is_new) in enumerate(zip(products, is_new)):
+        try:
+            await send_find_product_message(chat_id, product, product_is_new)
+        except BadRequest as e:
+            logger.error(f'Failed to send product {product.bank_product_id} to chat {chat_id}. Traceback: {e}')
+        except Exception as e:
+            # send_find_product_message падає лише до доставки, тож товар n теж не відправлений.
+            # Вже відправлені товари не повторюються - решта повертається в чергу окремими задачами
+            logger.warning(f'Failed to send product {product.bank_product_id} to chat {chat_id}: {e!r}. '
+                           f'Requeue {len(products) - n} products.')
+            await outbound_queue.enqueue_many(JobKind.product_alert, [
+                {'chat_id': chat_id, 'product': item.dict(), 'is_new': item_is_new}
+                for item, item_is_new in zip(products[n:], is_new[n:])
+            ], delay=e.timeout if isinstance(e, RetryAfter) else 0)
+            return
 
 
 async def remove_user_from_channel(chat_id: str, user_id: int):
@@ -224,24 +385,39 @@ async def remove_user_from_channel(chat_id: str, user_id: int):
         pass
 
 
-async def send_report():
+@outbound_queue.handler(JobKind.report)
+async def send_report(report_date: str | None = None):
     start_time = time.time()
-    today = datetime.date.today()
-    start_dt = datetime.datetime.combine(today, datetime.time.min)
-    end_dt = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time.min)
-    new_products = await ProductCRUD.get_many(filter={
-        'available_from': {'$gte': start_dt, '$lt': end_dt}
-    })
-    cursor = await ClientCRUD.get_many(
-        filter={'expired_at': {'$gte': datetime.datetime.now(tz=settings.default_tz)}},
-        cursor_mode=True
+    # Дата фіксується в задачі, щоб відкладений після півночі звіт не став звітом за наступний день
+    if report_date:
+        today = datetime.date.fromisoformat(report_date)
+    else:
+        today = datetime.datetime.now(tz=settings.default_tz).date()
+    start_dt = settings.default_tz.localize(datetime.datetime.combine(today, datetime.time.min))
+    end_dt = settings.default_tz.localize(datetime.datetime.combine(today + datetime.timedelta(days=1),
+                                                                    datetime.time.min))
+    # Події за день лежать в одному бакеті на товар, тож звіт не сканує колекцію coins
+    events = await ProductEventCRUD.get_events(start_dt, end_dt, [ChangeType.new, ChangeType.restocked])
+    new_products = {event.bank_product_id: event for event in events if event.type == ChangeType.new}
+    restocked_products = {event.bank_product_id: event for event in events
+                          if event.type == ChangeType.restocked and event.bank_product_id not in new_products}
+    message_model = report_notification_message(
+        new_products=list(new_products.values()),
+        restocked_products=list(restocked_products.values())
     )
-    message_model = report_notification_message(new_products=new_products)
-    async for client in cursor:
-        try:
-            await bot.send_message(chat_id=client['chat_id'], text=message_model.text)
-        except BotBlocked:
-            pass
+    try:
+        summary = await broadcast(
+            key=f'report:{today.isoformat()}',
+            filter={'expired_at': {'$gte': datetime.datetime.now(tz=settings.default_tz)}},
+            send=lambda chat_id: bot.send_message(chat_id=chat_id, text=message_model.text)
+        )
+    except BroadcastLeaseError as e:
+        # Звіт вже розсилає інший воркер. Перевіримо пізніше: якщо він впав, розсилка продовжиться з його прогресу
+        logger.warning(f'{e}. Check again in {settings.broadcast_lease_timeout} sec.')
+        await outbound_queue.enqueue(JobKind.report, {'report_date': today.isoformat()},
+                                     delay=settings.broadcast_lease_timeout)
+        return
 
     logger.info(f'Task send report notifications completed work at '
-                f'{round(time.time() - start_time, 2)} sec.')
+                f'{round(time.time() - start_time, 2)} sec. Throughput: {summary.messages_per_sec} msg/sec.')
+    return summary
@@ -36,6 +36,63 @@ class Settings(BaseSettings):
     fondy_merchant_id: str
     fondy_secret_key: str
 
+    # Parser
+    parser_backend: str = 'lxml'  # lxml | html.parser
+    parser_concurrency: int = 8
+    parser_connections_per_host: int = 8
+    parser_dns_cache_ttl: int = 300
+    parser_keepalive_timeout: int = 60
+    parser_process_pool_size: int = 2  # 0 - парсинг в основному процесі
+    parser_scheduler_enabled: bool = True
+    parser_interval: float = 60  # in seconds
+    parser_min_interval: float = 15
+    parser_max_interval: float = 300
+    parser_interval_jitter: float = 0.1  # частка від інтервалу
+    parser_probe_interval: float = 10  # 0 - швидка перевірка вимкнена
+    parser_probe_pages: list[str] = ['catalog.html']
+    parser_request_timeout: float = 15  # in seconds, на один запит разом з читанням тіла
+    parser_retries: int = 2
+    parser_retry_backoff: float = 0.5  # затримка перед першим повтором, далі подвоюється
+    parser_retry_backoff_max: float = 5
+    parser_hedge_percentile: float = 95  # 0 - дублюючі запити вимкнені
+    parser_hedge_min_samples: int = 20
+    parser_breaker_threshold: int = 5  # сторінок поспіль, що не завантажились після всіх повторів
+    parser_breaker_cooldown: float = 120
+    parser_sold_out_after_crawls: int = 2  # повних обходів поспіль без товару, перш ніж позначити його sold_out
+
+    # Службовий чат, куди заздалегідь завантажуються фото нових товарів для кешу file_id. None - вимкнено
+    image_cache_chat_id: str | None = None
+
+    # Webhook updates
+    update_workers: int = 8  # оновлення одного чату завжди обробляє той самий воркер
+    update_queue_size: int = 1000  # на воркер, при переповненні webhook чекає на місце в черзі
+    update_drain_timeout: float = 5  # in seconds, скільки дообробляти чергу при зупинці
+    update_inline_reply_timeout: float = 0.5  # скільки webhook чекає на відповідь обробника. 0 - вимкнено
+    update_dedup_size: int = 10000  # скільки останніх update_id пам'ятати в процесі
+    update_dedup_mongo: bool = False  # спільна перевірка дублікатів для кількох процесів через Mongo
+    update_dedup_ttl: int = 3600  # in seconds, скільки зберігати update_id в Mongo
+
+    # Кеш статусу підписки клієнтів за chat_id
+    subscription_cache_ttl: float = 300  # in seconds
+    subscription_cache_size: int = 10000
+
+    # Broadcast
+    broadcast_rate: float = 30  # messages per second, ліміт Telegram для розсилок
+    broadcast_concurrency: int = 20
+    broadcast_batch_size: int = 200  # розмір пачки між збереженнями прогресу
+    broadcast_max_retries: int = 3  # повтори для одного чату після RetryAfter
+    broadcast_lease_timeout: float = 300  # in seconds, продовжується після кожної пачки
+
+    # Outbound queue
+    outbound_workers: int = 4
+    outbound_poll_interval: float = 1  # in seconds, як часто воркери перевіряють відкладені задачі
+    outbound_max_attempts: int = 5
+    outbound_retry_backoff: float = 2
+    outbound_retry_backoff_max: float = 300
+    outbound_visibility_timeout: float = 900  # після цього задача зі статусом processing вважається втраченою
+    alert_coalesce_window: float = 1.5  # in seconds, скільки чекати інші сповіщення для альбому
+    alert_album_size: int = 10  # максимум фото в send_media_group
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
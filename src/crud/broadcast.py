@@ -0,0 +1,65 @@
+import datetime
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.models.collections import BroadcastsCollection
+from src.schemas.mongo_collections import Broadcast
+
+
+class BroadcastCRUD:
+
+    @classmethod
+    async def acquire_lease(cls,
+                            key: str,
+                            lease_id: str,
+                            dt_now: datetime.datetime,
+                            lease_timeout: float) -> Broadcast | None:
+        """ Створює розсилку або забирає її, якщо вона вільна чи lease попереднього власника минув.
+        Повертає None, якщо розсилку зараз веде інший воркер """
+        try:
+            result = await BroadcastsCollection.find_one_and_update(
+                {'_id': key, '$or': [
+                    {'lease_until': None},
+                    {'lease_until': {'$lt': dt_now}},
+                    {'lease_id': lease_id}
+                ]},
+                {
+                    '$set': {'lease_id': lease_id, 'lease_until': dt_now + datetime.timedelta(seconds=lease_timeout)},
+                    '$setOnInsert': {'started': dt_now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Документ є, але lease чужий - upsert спробував вставити той самий _id
+            return
+        return Broadcast(**result)
+
+    @classmethod
+    async def save_progress(cls,
+                            key: str,
+                            lease_id: str,
+                            lease_until: datetime.datetime,
+                            last_chat_id: int,
+                            sent: int,
+                            failed: int,
+                            blocked: int,
+                            seconds: float) -> bool:
+        """ Зберігає прогрес і продовжує lease. Повертає False, якщо lease вже забрав інший воркер """
+        result = await BroadcastsCollection.update_one(
+            {'_id': key, 'lease_id': lease_id},
+            {
+                '$set': {'last_chat_id': last_chat_id, 'lease_until': lease_until},
+                '$inc': {'sent': sent, 'failed': failed, 'blocked': blocked, 'seconds': seconds}
+            }
+        )
+        return result.matched_count > 0
+
+    @classmethod
+    async def finish(cls, key: str, lease_id: str, dt_now: datetime.datetime) -> bool:
+        result = await BroadcastsCollection.update_one(
+            {'_id': key, 'lease_id': lease_id},
+            {'$set': {'finished': dt_now, 'lease_id': None, 'lease_until': None}}
+        )
+        return result.matched_count > 0
@@ -1,9 +1,10 @@
-from typing import Any
+from collections import defaultdict
+from typing import Any, AsyncIterator
 
 from bson import ObjectId
 
 from src.models.collections import ClientsCollection, PaymentsCollection
-from src.schemas.mongo_collections import Client, ClientIn, ClientOut, ClientUpdateFields
+from src.schemas.mongo_collections import Client, ClientIn, ClientOut, ClientSubscription, ClientUpdateFields
 
 
 class ClientCRUD:
@@ -19,9 +20,24 @@ class ClientCRUD:
 
         result = await ClientsCollection.find_one(filter)
         if result:
-            payments_cursor = PaymentsCollection.find({'client_id': result['_id']})
-            result['payments'] = [item async for item in payments_cursor]
-            return ClientOut(**result)
+            # Платежі дозапитуються через $in по індексу payments.client_id
+            clients = await cls.__attach_payments([result])
+            return clients[0]
+        return
+
+    @classmethod
+    async def get_subscription(cls, id: str | None = None, chat_id: int | None = None) -> ClientSubscription | None:
+        """ Легкий запит лише полів підписки, без завантаження платежів """
+        if id:
+            filter = {'_id': ObjectId(id)}
+        elif chat_id:
+            filter = {'chat_id': chat_id}
+        else:
+            return
+
+        result = await ClientsCollection.find_one(filter, {'chat_id': 1, 'expired_at': 1, 'in_channel': 1})
+        if result:
+            return ClientSubscription(**result)
         return
 
     @classmethod
@@ -31,14 +47,35 @@ class ClientCRUD:
             return cursor
 
         if with_payments:
-            clients = []
-            async for item in cursor:
-                payments_cursor = PaymentsCollection.find({'client_id': item['_id']})
-                item['payments'] = [item async for item in payments_cursor]
-                clients.append(ClientOut(**item))
-            return clients
+            return [client async for page in cls.iter_with_payments(filter) for client in page]
         return [ClientOut(**item) async for item in cursor]
 
+    @classmethod
+    async def iter_with_payments(cls, filter: dict[str, Any], page_size: int = 500) -> AsyncIterator[list[ClientOut]]:
+        """ Віддає клієнтів з платежами сторінками по page_size. На кожну сторінку - один запит платежів
+        через $in, тож кількість запитів не залежить від кількості платежів """
+        cursor = ClientsCollection.find(filter).sort('_id', 1).batch_size(page_size)
+        page = []
+        async for item in cursor:
+            page.append(item)
+            if len(page) >= page_size:
+                yield await cls.__attach_payments(page)
+                page = []
+        if page:
+            yield await cls.__attach_payments(page)
+
+    @classmethod
+    async def __attach_payments(cls, clients: list[dict[str, Any]]) -> list[ClientOut]:
+        client_ids = [item['_id'] for item in clients]
+        # Платежі зберігають client_id рядком, але старі записи можуть мати ObjectId
+        payments_cursor = PaymentsCollection.find(
+            {'client_id': {'$in': client_ids + [str(client_id) for client_id in client_ids]}}
+        )
+        payments_by_client = defaultdict(list)
+        async for payment in payments_cursor:
+            payments_by_client[str(payment['client_id'])].append(payment)
+        return [ClientOut(**item, payments=payments_by_client[str(item['_id'])]) for item in clients]
+
     @classmethod
     async def insert_one(cls, client_in: ClientIn):
         client = Client(**client_in.dict())
@@ -57,3 +94,11 @@ class ClientCRUD:
     async def exists_by_chat_id(cls, chat_id: int) -> bool:
         result = await ClientsCollection.find_one({"chat_id": chat_id})
         return bool(result)
+
+    @classmethod
+    async def set_bot_blocked(cls, chat_ids: list[int], bot_blocked: bool = True):
+        result = await ClientsCollection.update_many(
+            {'chat_id': {'$in': chat_ids}, 'bot_blocked': {'$ne': bot_blocked}},
+            {'$set': {'bot_blocked': bot_blocked}}
+        )
+        return result
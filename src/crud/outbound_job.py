@@ -0,0 +1,118 @@
+import datetime
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from src.models.collections import OutboundJobsCollection
+from src.schemas.mongo_collections import OutboundJob
+from src.utils.enums import JobKind, JobStatus
+
+
+class OutboundJobCRUD:
+
+    @classmethod
+    async def ensure_indexes(cls):
+        await OutboundJobsCollection.create_index(
+            [('status', ASCENDING), ('priority', ASCENDING), ('run_at', ASCENDING)]
+        )
+        await OutboundJobsCollection.create_index('claim_id', sparse=True)
+
+    @classmethod
+    async def insert_many(cls, jobs: list[dict[str, Any]]) -> list[ObjectId]:
+        result = await OutboundJobsCollection.insert_many(jobs, ordered=False)
+        return result.inserted_ids
+
+    @classmethod
+    async def claim(cls, dt_now: datetime.datetime, visibility_timeout: float) -> OutboundJob | None:
+        """ Атомарно забирає найпріоритетнішу задачу, час якої настав. Задачі, які забрав воркер,
+        що впав, повертаються в роботу після закінчення locked_until """
+        result = await OutboundJobsCollection.find_one_and_update(
+            {'$or': [
+                {'status': JobStatus.pending, 'run_at': {'$lte': dt_now}},
+                {'status': JobStatus.processing, 'locked_until': {'$lt': dt_now}}
+            ]},
+            {
+                '$set': {
+                    'status': JobStatus.processing,
+                    'locked_until': dt_now + datetime.timedelta(seconds=visibility_timeout)
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('priority', ASCENDING), ('run_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if result:
+            return OutboundJob(**result)
+        return
+
+    @classmethod
+    async def claim_many(cls,
+                         filter: dict[str, Any],
+                         dt_now: datetime.datetime,
+                         visibility_timeout: float,
+                         limit: int) -> list[OutboundJob]:
+        """ Забирає до limit задач, час яких настав, за додатковим фільтром. Мітка claim_id гарантує,
+        що кожен воркер отримає лише ті задачі, які позначив саме він """
+        if limit <= 0:
+            return []
+        cursor = OutboundJobsCollection.find(
+            {**filter, 'status': JobStatus.pending, 'run_at': {'$lte': dt_now}},
+            {'_id': 1}
+        ).sort([('priority', ASCENDING), ('run_at', ASCENDING)]).limit(limit)
+        job_ids = [item['_id'] async for item in cursor]
+        if not job_ids:
+            return []
+
+        claim_id = ObjectId()
+        await OutboundJobsCollection.update_many(
+            {'_id': {'$in': job_ids}, 'status': JobStatus.pending},
+            {
+                '$set': {
+                    'status': JobStatus.processing,
+                    'claim_id': claim_id,
+                    'locked_until': dt_now + datetime.timedelta(seconds=visibility_timeout)
+                },
+                '$inc': {'attempts': 1}
+            }
+        )
+        cursor = OutboundJobsCollection.find({'claim_id': claim_id}).sort('run_at', ASCENDING)
+        return [OutboundJob(**item) async for item in cursor]
+
+    @classmethod
+    async def delete_many(cls, job_ids: list[ObjectId]):
+        result = await OutboundJobsCollection.delete_many({'_id': {'$in': job_ids}})
+        return result
+
+    @classmethod
+    async def reschedule(cls, job_ids: list[ObjectId], run_at: datetime.datetime, error: str):
+        result = await OutboundJobsCollection.update_many(
+            {'_id': {'$in': job_ids}},
+            {'$set': {'status': JobStatus.pending, 'run_at': run_at, 'locked_until': None, 'last_error': error}}
+        )
+        return result
+
+    @classmethod
+    async def dead_letter(cls, job_ids: list[ObjectId], error: str):
+        result = await OutboundJobsCollection.update_many(
+            {'_id': {'$in': job_ids}},
+            {'$set': {'status': JobStatus.dead, 'locked_until': None, 'last_error': error}}
+        )
+        return result
+
+    @classmethod
+    async def count_by_status(cls) -> dict[str, dict[str, int]]:
+        cursor = OutboundJobsCollection.aggregate([
+            {'$group': {'_id': {'status': '$status', 'kind': '$kind'}, 'count': {'$sum': 1}}}
+        ])
+        counts: dict[str, dict[str, int]] = {}
+        async for item in cursor:
+            counts.setdefault(item['_id']['status'], {})[item['_id']['kind']] = item['count']
+        return counts
+
+    @classmethod
+    async def get_dead(cls, kind: JobKind | None = None) -> list[OutboundJob]:
+        filter: dict[str, Any] = {'status': JobStatus.dead}
+        if kind:
+            filter['kind'] = kind
+        return [OutboundJob(**item) async for item in OutboundJobsCollection.find(filter)]
@@ -8,6 +8,10 @@ from src.schemas.mongo_collections import Payment, PaymentIn, PaymentUpdateField
 
 class PaymentCRUD:
 
+    @classmethod
+    async def ensure_indexes(cls):
+        await PaymentsCollection.create_index('client_id')
+
     @classmethod
     async def get_one(cls, payment_id: str) -> dict[str, Any] | None:
         product = await PaymentsCollection.find_one({"_id": ObjectId(payment_id)})
@@ -0,0 +1,22 @@
+import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from src.config.settings import settings
+from src.models.collections import ProcessedUpdatesCollection
+
+
+class ProcessedUpdateCRUD:
+
+    @classmethod
+    async def ensure_indexes(cls):
+        await ProcessedUpdatesCollection.create_index('created', expireAfterSeconds=settings.update_dedup_ttl)
+
+    @classmethod
+    async def insert_if_new(cls, update_id: int, dt_now: datetime.datetime) -> bool:
+        """ Повертає False, якщо update_id вже було записано раніше """
+        try:
+            await ProcessedUpdatesCollection.insert_one({'_id': update_id, 'created': dt_now})
+        except DuplicateKeyError:
+            return False
+        return True
@@ -1,13 +1,29 @@
+import datetime
 from typing import Any
 
 from bson import ObjectId
+from pymongo import ASCENDING, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from src.config.settings import logger
 
 from src.models.collections import CoinsCollection
 from src.schemas.mongo_collections import Product, ProductUpdateFields, ProductOut
+from src.schemas.parser import CatalogChangeSet, PersistSummary
 
 
 class ProductCRUD:
 
+    @classmethod
+    async def ensure_indexes(cls):
+        try:
+            # Унікальність не дає паралельним upsert з обходу і швидкої перевірки створити дублікати товару
+            await CoinsCollection.create_index([('bank_product_id', ASCENDING)], unique=True)
+        except OperationFailure as e:
+            logger.error(f'Failed to create unique index on bank_product_id, duplicates in collection? Traceback: {e}')
+            await CoinsCollection.create_index([('bank_product_id', ASCENDING)])
+        await CoinsCollection.create_index([('sold_out', ASCENDING)])
+
     @classmethod
     async def get_one(cls, product_id: str) -> dict[str, Any] | None:
         product = await CoinsCollection.find_one({"_id": ObjectId(product_id)})
@@ -56,3 +72,113 @@ class ProductCRUD:
             {'$set': update_fields.dict(exclude_none=True)}
         )
         return result
+
+    @classmethod
+    async def get_image_file_ids(cls, bank_product_ids: list[int]) -> dict[int, str]:
+        cursor = CoinsCollection.find(
+            {'bank_product_id': {'$in': bank_product_ids}, 'image_file_id': {'$ne': None}},
+            {'bank_product_id': 1, 'image_file_id': 1}
+        )
+        return {item['bank_product_id']: item['image_file_id'] async for item in cursor}
+
+    @classmethod
+    async def set_image_file_ids(cls, file_ids: dict[int, str]):
+        if not file_ids:
+            return
+        result = await CoinsCollection.bulk_write([
+            UpdateOne({'bank_product_id': bank_product_id}, {'$set': {'image_file_id': file_id}})
+            for bank_product_id, file_id in file_ids.items()
+        ], ordered=False)
+        return result
+
+    @classmethod
+    async def unset_image_file_ids(cls, bank_product_ids: list[int]):
+        result = await CoinsCollection.update_many(
+            {'bank_product_id': {'$in': bank_product_ids}},
+            {'$unset': {'image_file_id': ''}}
+        )
+        return result
+
+    @classmethod
+    async def insert_new(cls, products: list[Product]) -> int:
+        """ Записує нові товари одразу, ще до кінця обходу, щоб сповіщення могли зберегти в них image_file_id """
+        if not products:
+            return 0
+        try:
+            result = await CoinsCollection.bulk_write([cls.__upsert_new(product) for product in products],
+                                                      ordered=False)
+        except BulkWriteError as e:
+            # Товар вже вставив паралельний запуск - для $setOnInsert це той самий результат
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+            return e.details.get('nUpserted', 0)
+        return result.upserted_count
+
+    @staticmethod
+    def __upsert_new(product: Product) -> UpdateOne:
+        return UpdateOne({'bank_product_id': product.bank_product_id}, {'$setOnInsert': product.dict()}, upsert=True)
+
+    @classmethod
+    async def bulk_persist(cls, change_set: CatalogChangeSet, dt_now: datetime.datetime) -> PersistSummary:
+        """ Записує зміни каталогу одним невпорядкованим bulk_write замість запиту на кожен товар """
+        updates: dict[Any, dict[str, Any]] = {}
+        for change in change_set.restocked:
+            updates[change.previous.id] = ProductUpdateFields(
+                available_from=dt_now,
+                sold_out=False,
+                name=change.product.name,
+                price=change.product.price,
+                url=change.product.url,
+                image_url=change.product.image_url
+            ).dict(exclude_none=True)
+        for change in change_set.price_changed:
+            updates.setdefault(change.previous.id, {})['price'] = change.product.price
+        for change in change_set.metadata_changed:
+            updates.setdefault(change.previous.id, {}).update(
+                ProductUpdateFields(
+                    name=change.product.name,
+                    url=change.product.url,
+                    image_url=change.product.image_url
+                ).dict(exclude_none=True)
+            )
+        # Закешований file_id належить старому фото
+        image_changed_ids = [
+            change.previous.id for change in change_set.restocked + change_set.metadata_changed
+            if change.previous.image_file_id and change.previous.image_url != change.product.image_url
+        ]
+
+        operations = []
+        if change_set.sold_out:
+            operations.append(UpdateMany(
+                {'_id': {'$in': [change.previous.id for change in change_set.sold_out]}},
+                {'$set': {'sold_out': True, 'updated': dt_now}}
+            ))
+        if image_changed_ids:
+            operations.append(UpdateMany({'_id': {'$in': image_changed_ids}}, {'$unset': {'image_file_id': ''}}))
+        # Нові товари могли бути вже записані через insert_new, тому вставка ідемпотентна
+        operations.extend(cls.__upsert_new(change.product) for change in change_set.new)
+        operations.extend(
+            UpdateOne({'_id': product_id}, {'$set': {**update_fields, 'updated': dt_now}})
+            for product_id, update_fields in updates.items()
+        )
+
+        summary = PersistSummary(
+            present=len(change_set.present_ids),
+            new=len(change_set.new),
+            restocked=len(change_set.restocked),
+            sold_out=len(change_set.sold_out),
+            price_changed=len(change_set.price_changed),
+            metadata_changed=len(change_set.metadata_changed)
+        )
+        if not operations:
+            return summary
+        try:
+            result = await CoinsCollection.bulk_write(operations, ordered=False)
+            summary.inserted = result.upserted_count
+            summary.modified = result.modified_count
+        except BulkWriteError as e:
+            logger.error(f'Bulk write finished with errors: {e.details.get("writeErrors")}')
+            summary.inserted = e.details.get('nUpserted', 0)
+            summary.modified = e.details.get('nModified', 0)
+            summary.errors = len(e.details.get('writeErrors', []))
+        return summary
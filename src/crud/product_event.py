@@ -0,0 +1,109 @@
+import datetime
+from typing import Any
+
+from pymongo import ASCENDING, UpdateOne
+
+from src.config.settings import settings
+from src.models.collections import ProductEventsCollection
+from src.schemas.mongo_collections import ProductEvent, ProductEventOut
+from src.schemas.parser import CatalogChangeSet
+from src.utils.enums import ChangeType
+
+
+class ProductEventCRUD:
+    """ Історія змін товарів. Події зберігаються бакетами - один документ на товар за день:
+    {bank_product_id, day: 'YYYY-MM-DD', name, count, events: [ProductEvent, ...]} """
+
+    @classmethod
+    async def ensure_indexes(cls):
+        await ProductEventsCollection.create_index([('bank_product_id', ASCENDING), ('day', ASCENDING)], unique=True)
+        await ProductEventsCollection.create_index([('day', ASCENDING), ('events.type', ASCENDING)])
+
+    @classmethod
+    def _day(cls, dt: datetime.datetime) -> str:
+        return dt.astimezone(settings.default_tz).strftime('%Y-%m-%d')
+
+    @classmethod
+    async def append_from_change_set(cls, change_set: CatalogChangeSet, dt_now: datetime.datetime) -> int:
+        events: list[tuple[int, str, ProductEvent]] = []
+        for change in change_set.new:
+            events.append((change.product.bank_product_id, change.product.name,
+                           ProductEvent(type=ChangeType.new, new=change.product.price, created=dt_now)))
+        for change in change_set.restocked:
+            events.append((change.product.bank_product_id, change.product.name,
+                           ProductEvent(type=ChangeType.restocked, old=change.previous.price,
+                                        new=change.product.price, created=dt_now)))
+        for change in change_set.sold_out:
+            events.append((change.product.bank_product_id, change.product.name,
+                           ProductEvent(type=ChangeType.sold_out, old=change.product.price, created=dt_now)))
+        for change in change_set.price_changed:
+            events.append((change.product.bank_product_id, change.product.name,
+                           ProductEvent(type=ChangeType.price_changed, old=change.previous.price,
+                                        new=change.product.price, created=dt_now)))
+        for change in change_set.metadata_changed:
+            events.append((change.product.bank_product_id, change.product.name,
+                           ProductEvent(type=ChangeType.metadata_changed,
+                                        old={'name': change.previous.name, 'url': change.previous.url,
+                                             'image_url': change.previous.image_url},
+                                        new={'name': change.product.name, 'url': change.product.url,
+                                             'image_url': change.product.image_url},
+                                        created=dt_now)))
+        if not events:
+            return 0
+
+        day = cls._day(dt_now)
+        operations = [
+            UpdateOne(
+                {'bank_product_id': bank_product_id, 'day': day},
+                {
+                    '$push': {'events': event.dict()},
+                    '$inc': {'count': 1},
+                    '$set': {'name': name}
+                },
+                upsert=True
+            )
+            for bank_product_id, name, event in events
+        ]
+        await ProductEventsCollection.bulk_write(operations, ordered=False)
+        return len(events)
+
+    @classmethod
+    async def get_events(cls,
+                         start: datetime.datetime,
+                         end: datetime.datetime,
+                         event_types: list[ChangeType] | None = None,
+                         bank_product_id: int | None = None) -> list[ProductEventOut]:
+        bucket_filter: dict[str, Any] = {'day': {'$gte': cls._day(start), '$lte': cls._day(end)}}
+        event_filter: dict[str, Any] = {'events.created': {'$gte': start, '$lt': end}}
+        if bank_product_id is not None:
+            bucket_filter['bank_product_id'] = bank_product_id
+        if event_types:
+            bucket_filter['events.type'] = {'$in': event_types}
+            event_filter['events.type'] = {'$in': event_types}
+
+        cursor = ProductEventsCollection.aggregate([
+            {'$match': bucket_filter},
+            {'$unwind': '$events'},
+            {'$match': event_filter},
+            {'$sort': {'events.created': ASCENDING}},
+            {'$project': {'_id': 0, 'bank_product_id': 1, 'name': 1, 'type': '$events.type', 'old': '$events.old',
+                          'new': '$events.new', 'created': '$events.created'}}
+        ])
+        return [ProductEventOut(**item) async for item in cursor]
+
+    @classmethod
+    async def restocks_in_range(cls, start: datetime.datetime, end: datetime.datetime) -> list[ProductEventOut]:
+        return await cls.get_events(start, end, [ChangeType.restocked])
+
+    @classmethod
+    async def price_history(cls, bank_product_id: int) -> list[ProductEventOut]:
+        """ Ціна товару в часі: перша ціна з події new/restocked і всі подальші зміни ціни """
+        cursor = ProductEventsCollection.aggregate([
+            {'$match': {'bank_product_id': bank_product_id}},
+            {'$unwind': '$events'},
+            {'$match': {'events.type': {'$in': [ChangeType.new, ChangeType.restocked, ChangeType.price_changed]}}},
+            {'$sort': {'events.created': ASCENDING}},
+            {'$project': {'_id': 0, 'bank_product_id': 1, 'name': 1, 'type': '$events.type', 'old': '$events.old',
+                          'new': '$events.new', 'created': '$events.created'}}
+        ])
+        return [ProductEventOut(**item) async for item in cursor]
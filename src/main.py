@@ -1,21 +1,27 @@
 import datetime
-import time
 
 import uvicorn
-from aiogram import types, Dispatcher, Bot
+from aiogram import types
 from fastapi import FastAPI, Request
-from starlette.background import BackgroundTasks
 
 from src.config.settings import settings, logger
-from src.bot import bot, dp, send_approve_payment_msg, remove_user_from_channel, send_report
+from src.bot import bot, remove_user_from_channel
 from src.crud.payment import PaymentCRUD
 from src.crud.client import ClientCRUD
+from src.crud.outbound_job import OutboundJobCRUD
+from src.crud.processed_update import ProcessedUpdateCRUD
+from src.crud.product import ProductCRUD
+from src.crud.product_event import ProductEventCRUD
 from src.services.payment_controller import PaymentController
-from src.services.product_parser import parser_processing
+from src.services.outbound_queue import outbound_queue
+from src.services.product_parser import product_parser
+from src.services.scheduler import parser_scheduler
+from src.services.update_dedup import update_deduplicator
+from src.services.update_ingress import update_ingress
 from src.schemas.mongo_collections import PaymentUpdateFields
 from src.utils.bot_helpers import get_bot_commands
-from src.utils.enums import ExpireDateAction
-from src.utils.helpers import update_client_expire_date
+from src.utils.enums import ExpireDateAction, JobKind
+from src.utils.helpers import subscription_cache, update_client_expire_date
 
 app = FastAPI()
 
@@ -34,14 +40,35 @@ async def on_startup():
     webhook_info = await bot.get_webhook_info()
     if webhook_info.url != settings.bot_webhook():
         await bot.set_webhook(url=settings.bot_webhook())
+    await PaymentCRUD.ensure_indexes()
+    await ProductCRUD.ensure_indexes()
+    await ProductEventCRUD.ensure_indexes()
+    await OutboundJobCRUD.ensure_indexes()
+    if settings.update_dedup_mongo:
+        await ProcessedUpdateCRUD.ensure_indexes()
+    outbound_queue.start()
+    update_ingress.start()
+    if settings.parser_scheduler_enabled:
+        parser_scheduler.start()
+
+
+@app.on_event('shutdown')
+async def on_shutdown():
+    await update_ingress.stop()
+    await parser_scheduler.stop()
+    await outbound_queue.stop()
+    await product_parser.close()
 
 
 @app.post(f'/bot/{settings.bot_api_token}')
 async def bot_webhook(update: dict):
-    telegram_update = types.Update(**update)
-    Dispatcher.set_current(dp)
-    Bot.set_current(bot)
-    await dp.process_update(telegram_update)
+    # Повторна доставка того самого оновлення відкидається ще до черги і обробників
+    if await update_deduplicator.is_duplicate(update['update_id']):
+        return
+    # Оновлення обробляється воркером свого чату. Якщо обробник швидко повернув одну відповідь,
+    # вона йде в тілі відповіді на webhook, інакше відповідаємо Telegram порожнім 200
+    reply = await update_ingress.submit(types.Update(**update))
+    return await update_ingress.wait_reply(reply)
 
 
 @app.post('/payments/approve')
@@ -58,8 +85,11 @@ async def approve_payment(request: Request):
         )
         if result.modified_count > 0:
             if status == 'Approved':
-                await send_approve_payment_msg(payment['client_id'], payment['_id'])
                 await update_client_expire_date(payment['client_id'], ExpireDateAction.add)
+                await outbound_queue.enqueue(
+                    JobKind.approve_payment,
+                    {'client_id': payment['client_id'], 'order_reference': payment['_id']}
+                )
             elif status == 'Refunded':
                 await update_client_expire_date(payment['client_id'], ExpireDateAction.subtract)
 
@@ -80,7 +110,10 @@ async def fondy_approve_payment(request: Request):
         if result.modified_count > 0:
             if status == 'approved':
                 await update_client_expire_date(payment['client_id'], ExpireDateAction.add)
-                await send_approve_payment_msg(payment['client_id'], payment['_id'])
+                await outbound_queue.enqueue(
+                    JobKind.approve_payment,
+                    {'client_id': payment['client_id'], 'order_reference': payment['_id']}
+                )
             elif status == 'reversed':
                 await update_client_expire_date(payment['client_id'], ExpireDateAction.subtract)
         else:
@@ -90,8 +123,8 @@ async def fondy_approve_payment(request: Request):
 
 
 @app.get('/report')
-async def report(background_tasks: BackgroundTasks):
-    background_tasks.add_task(send_report)
+async def report():
+    await outbound_queue.enqueue(JobKind.report)
     return 'OK'
 
 
@@ -111,11 +144,32 @@ async def check_subscribe():
             logger.error(f'Error in check_subscribe method. Traceback: {e}')
 
 
+@app.get('/stats')
+async def stats():
+    return {
+        'parser': {
+            'last_crawl_time': product_parser.last_crawl_time,
+            'last_skipped_pages': product_parser.last_skipped_pages,
+            'last_reused_products': product_parser.last_reused_products,
+            'last_loop_blocked_time': product_parser.last_loop_blocked_time,
+            'crawl_time': product_parser.crawl_times.to_dict(),
+            'fetch': product_parser.fetcher.stats()
+        },
+        'outbound_queue': await outbound_queue.stats(),
+        'updates': {**update_ingress.stats(), **update_deduplicator.stats()},
+        'subscription_cache': subscription_cache.stats(),
+        'scheduler': {
+            'is_running': parser_scheduler.is_running,
+            'interval': parser_scheduler.interval,
+            'last_run_at': parser_scheduler.last_run_at,
+            'last_run_time': parser_scheduler.last_run_time
+        }
+    }
+
+
 @app.get('/start_parser')
-async def start_parser(background_tasks: BackgroundTasks):
-    t = time.time()
-    await parser_processing(background_tasks)
-    logger.info(f'Parse finished at {round((time.time() - t), 2)} seconds.')
+async def start_parser():
+    await parser_scheduler.run_once()
 
 
 if __name__ == '__main__':
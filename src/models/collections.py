@@ -15,3 +15,7 @@ CoinsCollection: AgnosticCollection = CoinsDB['coins']
 ClientsCollection: AgnosticCollection = CoinsDB['clients']
 PaymentsCollection: AgnosticCollection = CoinsDB['payments']
 InviteCollection: AgnosticCollection = CoinsDB['invites']
+ProductEventsCollection: AgnosticCollection = CoinsDB['product_events']
+BroadcastsCollection: AgnosticCollection = CoinsDB['broadcasts']
+OutboundJobsCollection: AgnosticCollection = CoinsDB['outbound_jobs']
+ProcessedUpdatesCollection: AgnosticCollection = CoinsDB['processed_updates']
@@ -18,3 +18,14 @@ class MessageKeyboard(str):
 class MessageModel(BaseModel):
     text: str
     keyboard: MessageKeyboard | None = None
+
+
+class BroadcastSummary(BaseModel):
+    key: str
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    seconds: float = 0
+    messages_per_sec: float = 0
+    resumed: bool = False
+    already_finished: bool = False
@@ -6,6 +6,7 @@ from pydantic import BaseModel, validator, Field
 from pydantic.types import PositiveInt
 
 from src.config.settings import settings
+from src.utils.enums import ChangeType, JobKind, JobStatus
 
 
 class Product(BaseModel):
@@ -17,6 +18,8 @@ class Product(BaseModel):
     price: int
     url: str
     image_url: str
+    # file_id фото в Telegram після першої відправки, щоб Telegram не завантажував image_url повторно
+    image_file_id: str | None = None
     material: str | None = None
     circulation: int | str | None = None
     year_of_production: int | None = None
@@ -39,6 +42,19 @@ class ProductUpdateFields(BaseModel):
     name: str | None = None
     url: str | None = None
     image_url: str | None = None
+    image_file_id: str | None = None
+
+
+class ProductEvent(BaseModel):
+    type: ChangeType
+    old: Any = None
+    new: Any = None
+    created: datetime.datetime
+
+
+class ProductEventOut(ProductEvent):
+    bank_product_id: int
+    name: str
 
 
 class Payment(BaseModel):
@@ -64,6 +80,11 @@ class Payment(BaseModel):
             return v
         return ObjectId(v)
 
+    @validator('client_id', pre=True)
+    def set_client_id(cls, v):
+        # Старі платежі могли зберігати client_id як ObjectId
+        return str(v)
+
 
 class PaymentUpdateFields(BaseModel):
     updated: datetime.datetime | None = None
@@ -100,6 +121,7 @@ class Client(BaseModel):
     chat_id: int
     expired_at: datetime.datetime | None
     in_channel: bool
+    bot_blocked: bool = False
 
 
 class ClientUpdateFields(BaseModel):
@@ -116,6 +138,7 @@ class ClientIn(BaseModel):
     chat_id: int
     expired_at: datetime.datetime | None = None
     in_channel: bool = False
+    bot_blocked: bool = False
 
     @validator('created', 'updated', 'expired_at', pre=True, always=True)
     def set_dates(cls, v):
@@ -133,6 +156,7 @@ class ClientOut(BaseModel):
     payments: list[Payment] = []
     expired_at: datetime.datetime | None = None
     in_channel: bool
+    bot_blocked: bool = False
 
     @validator('id', pre=True, always=True)
     def set_id(cls, v):
@@ -141,6 +165,49 @@ class ClientOut(BaseModel):
         return v
 
 
+class ClientSubscription(BaseModel):
+    """ Мінімум полів клієнта для перевірки підписки, без платежів """
+    id: str = Field(alias='_id')
+    chat_id: int
+    expired_at: datetime.datetime | None = None
+    in_channel: bool = False
+
+    @validator('id', pre=True, always=True)
+    def set_id(cls, v):
+        if isinstance(v, ObjectId):
+            return str(v)
+        return v
+
+
+class Broadcast(BaseModel):
+    id: str = Field(alias='_id')
+    started: datetime.datetime
+    finished: datetime.datetime | None = None
+    # chat_id останнього клієнта з повністю обробленої пачки, з нього продовжується перерваний запуск
+    last_chat_id: int | None = None
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    seconds: float = 0
+    # Розсилку з тим самим key одночасно веде лише власник lease_id, поки не мине lease_until
+    lease_id: str | None = None
+    lease_until: datetime.datetime | None = None
+
+
+class OutboundJob(BaseModel):
+    id: Any = Field(alias='_id')
+    kind: JobKind
+    payload: dict[str, Any] = {}
+    # Менше значення - вища пріоритетність
+    priority: int
+    status: JobStatus = JobStatus.pending
+    attempts: int = 0
+    run_at: datetime.datetime
+    locked_until: datetime.datetime | None = None
+    created: datetime.datetime
+    last_error: str | None = None
+
+
 class Invite(BaseModel):
     created: datetime.datetime | None = None
     link: str
@@ -0,0 +1,61 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+from src.schemas.mongo_collections import Product, ProductOut
+
+
+class PageSnapshot(BaseModel):
+    url: str
+    etag: str | None = None
+    last_modified: str | None = None
+    content_hash: str | None = None
+    pagination_urls: list[str] = []
+    products: list[Product] = []
+    # Хеші HTML-фрагментів товарів, в тому ж порядку, що й products
+    product_hashes: list[str] = []
+
+
+class FetchResponse(BaseModel):
+    url: str
+    status: int
+    text: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class ParsedPage(BaseModel):
+    pagination_urls: list[str] = []
+    # None - товар не парсився, бо хеш його HTML-фрагмента вже відомий
+    products_data: list[dict[str, Any] | None] = []
+    product_hashes: list[str] = []
+
+
+class ProductChange(BaseModel):
+    product: Product
+    previous: ProductOut | None = None
+
+
+class CatalogChangeSet(BaseModel):
+    present_ids: list[Any] = []
+    new: list[ProductChange] = []
+    restocked: list[ProductChange] = []
+    sold_out: list[ProductChange] = []
+    price_changed: list[ProductChange] = []
+    metadata_changed: list[ProductChange] = []
+
+    @property
+    def has_changes(self) -> bool:
+        return any([self.new, self.restocked, self.sold_out, self.price_changed, self.metadata_changed])
+
+
+class PersistSummary(BaseModel):
+    present: int = 0
+    new: int = 0
+    restocked: int = 0
+    sold_out: int = 0
+    price_changed: int = 0
+    metadata_changed: int = 0
+    inserted: int = 0
+    modified: int = 0
+    errors: int = 0
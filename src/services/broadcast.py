@@ -0,0 +1,112 @@
+import asyncio
+import datetime
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from aiogram.utils.exceptions import ChatNotFound, RetryAfter, TelegramAPIError, Unauthorized
+
+from src.config.settings import settings, logger
+from src.crud.broadcast import BroadcastCRUD
+from src.crud.client import ClientCRUD
+from src.schemas.bot import BroadcastSummary
+from src.utils.rate_limiter import TokenBucket
+
+class BroadcastLeaseError(Exception):
+    """ Розсилку з тим самим key зараз веде інший воркер """
+
+
+# Спільний для всіх розсилок ліміт, щоб паралельні розсилки разом не перевищували ліміт Telegram
+broadcast_bucket = TokenBucket(settings.broadcast_rate)
+
+
+class Broadcaster:
+    """ Розсилка повідомлення клієнтам за фільтром. Клієнти обробляються пачками в порядку chat_id,
+    всередині пачки - паралельно з обмеженням частоти через broadcast_bucket. Після кожної пачки прогрес
+    зберігається в колекцію broadcasts, тож перерваний запуск з тим самим key продовжується з наступної пачки.
+    Розсилку веде лише власник lease в документі broadcasts: він продовжується після кожної пачки, а якщо його
+    забрав інший воркер - розсилка зупиняється з BroadcastLeaseError, щоб клієнти не отримали повідомлення двічі """
+
+    def __init__(self, key: str, filter: dict[str, Any], send: Callable[[int], Awaitable[Any]]):
+        self.key = key
+        self.filter = filter
+        self.send = send
+        self.lease_id = uuid.uuid4().hex
+        self._semaphore = asyncio.Semaphore(settings.broadcast_concurrency)
+
+    async def run(self) -> BroadcastSummary:
+        start_time = time.monotonic()
+        dt_now = datetime.datetime.now(tz=settings.default_tz)
+        progress = await BroadcastCRUD.acquire_lease(self.key, self.lease_id, dt_now, settings.broadcast_lease_timeout)
+        if progress is None:
+            raise BroadcastLeaseError(f'Broadcast {self.key} is running in another worker')
+        summary = BroadcastSummary(key=self.key, resumed=progress.last_chat_id is not None)
+        if progress.finished:
+            logger.info(f'Broadcast {self.key} already finished at {progress.finished}. Skip.')
+            summary.already_finished = True
+            return summary
+
+        filter = {**self.filter, 'bot_blocked': {'$ne': True}}
+        if progress.last_chat_id is not None:
+            filter['chat_id'] = {'$gt': progress.last_chat_id}
+        cursor = await ClientCRUD.get_many(filter=filter, cursor_mode=True)
+        cursor = cursor.sort('chat_id', 1).batch_size(settings.broadcast_batch_size)
+
+        batch = []
+        async for client in cursor:
+            batch.append(client['chat_id'])
+            if len(batch) >= settings.broadcast_batch_size:
+                await self.__send_batch(batch, summary)
+                batch = []
+        if batch:
+            await self.__send_batch(batch, summary)
+        if not await BroadcastCRUD.finish(self.key, self.lease_id, datetime.datetime.now(tz=settings.default_tz)):
+            raise BroadcastLeaseError(f'Broadcast {self.key} lease was taken by another worker')
+
+        summary.seconds = round(time.monotonic() - start_time, 2)
+        summary.messages_per_sec = round(summary.sent / summary.seconds, 1) if summary.seconds else 0
+        logger.info(f'Broadcast {self.key} completed at {summary.seconds} sec. Sent: {summary.sent}, '
+                    f'failed: {summary.failed}, blocked: {summary.blocked}, '
+                    f'throughput: {summary.messages_per_sec} msg/sec.')
+        return summary
+
+    async def __send_batch(self, chat_ids: list[int], summary: BroadcastSummary):
+        start_time = time.monotonic()
+        results = await asyncio.gather(*[self.__send_one(chat_id) for chat_id in chat_ids])
+        sent = results.count('sent')
+        failed = results.count('failed')
+        blocked_chat_ids = [chat_id for chat_id, result in zip(chat_ids, results) if result == 'blocked']
+        if blocked_chat_ids:
+            await ClientCRUD.set_bot_blocked(blocked_chat_ids)
+
+        lease_until = datetime.datetime.now(tz=settings.default_tz) + datetime.timedelta(
+            seconds=settings.broadcast_lease_timeout)
+        saved = await BroadcastCRUD.save_progress(self.key, self.lease_id, lease_until, chat_ids[-1], sent, failed,
+                                                  len(blocked_chat_ids), round(time.monotonic() - start_time, 2))
+        if not saved:
+            raise BroadcastLeaseError(f'Broadcast {self.key} lease was taken by another worker. Stop.')
+        summary.sent += sent
+        summary.failed += failed
+        summary.blocked += len(blocked_chat_ids)
+
+    async def __send_one(self, chat_id: int) -> str:
+        async with self._semaphore:
+            for attempt in range(settings.broadcast_max_retries + 1):
+                await broadcast_bucket.acquire()
+                try:
+                    await self.send(chat_id)
+                    return 'sent'
+                except RetryAfter as e:
+                    # Чекає лише цей чат, решта розсилки продовжується
+                    logger.warning(f'Broadcast {self.key}: retry chat {chat_id} after {e.timeout} sec.')
+                    await asyncio.sleep(e.timeout)
+                except (Unauthorized, ChatNotFound):
+                    return 'blocked'
+                except TelegramAPIError as e:
+                    logger.error(f'Broadcast {self.key}: failed to send message to chat {chat_id}: {e}')
+                    return 'failed'
+        return 'failed'
+
+
+async def broadcast(key: str, filter: dict[str, Any], send: Callable[[int], Awaitable[Any]]) -> BroadcastSummary:
+    return await Broadcaster(key, filter, send).run()
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator
+
+import aiohttp
+
+from src.config.settings import settings, logger
+from src.schemas.mongo_collections import Product
+from src.schemas.parser import PageSnapshot, ProductChange
+from src.services.fetcher import FetchError, PageFetcher
+from src.services.parser_backends import extract_page, get_parser_backend
+from src.utils.histogram import LatencyHistogram
+
+
+class ProductParser:
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                      'AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/89.0.4389.82 Safari/537.36'
+    }
+
+    default_base_url = 'https://coins.bank.gov.ua/'
+
+    def __init__(self, base_url: str | None = None):
+        # base_url дозволяє направити парсер на локальний стенд замість сайту НБУ
+        self.bank_base_url = (base_url or self.default_base_url).rstrip('/') + '/'
+        self.catalog_page = self.bank_base_url + 'catalog.html'
+        self.backend = get_parser_backend(settings.parser_backend, self.bank_base_url)
+        self.last_crawl_time: float | None = None
+        self.last_skipped_pages = 0
+        self.last_reused_products = 0
+        self.last_crawl_complete = False
+        self.last_loop_blocked_time: float | None = None
+        self.crawl_times = LatencyHistogram(bounds=(1, 2.5, 5, 10, 20, 30, 60, 120), window=200)
+        self.page_snapshots: dict[str, PageSnapshot] = {}
+        # bank_product_id товарів, які були в наявності під час останнього обходу
+        self.known_ids: set[int] = set()
+        # bank_product_id товарів в наявності -> скільки повних обходів поспіль їх не було в каталозі
+        self.missed_crawls: dict[int, int] = {}
+        self._session: aiohttp.ClientSession | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self.fetcher = PageFetcher(self.__get_session)
+
+    def confirm_sold_out(self, missing: list[ProductChange]) -> list[ProductChange]:
+        """ Повертає товари, яких не було в parser_sold_out_after_crawls повних обходах поспіль.
+        Сторінки завантажуються паралельно, а нові товари на початку каталогу зсувають решту між сторінками
+        під час обходу, тож одного пропуску недостатньо, щоб вважати товар розпроданим """
+        missed_crawls = {}
+        confirmed = []
+        for change in missing:
+            product_id = change.product.bank_product_id
+            count = self.missed_crawls.get(product_id, 0) + 1
+            if count >= settings.parser_sold_out_after_crawls:
+                confirmed.append(change)
+            else:
+                missed_crawls[product_id] = count
+        # Товари, що знову з'явились у каталозі, починають відлік спочатку
+        self.missed_crawls = missed_crawls
+        return confirmed
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        # Одна сесія на весь час життя парсера, щоб не платити за TCP+TLS handshake на кожну сторінку
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=settings.parser_connections_per_host,
+                ttl_dns_cache=settings.parser_dns_cache_ttl,
+                keepalive_timeout=settings.parser_keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __load_page(self, url: str) -> PageSnapshot:
+        """ Завантажує сторінку каталогу. Якщо сторінка не змінилась з попереднього запуску
+        (304 або той самий хеш контенту) - повертає попередній знімок без повторного парсингу """
+        previous = self.page_snapshots.get(url)
+        headers = {}
+        if previous:
+            if previous.etag:
+                headers['If-None-Match'] = previous.etag
+            if previous.last_modified:
+                headers['If-Modified-Since'] = previous.last_modified
+
+        try:
+            response = await self.fetcher.fetch(url, headers)
+        except FetchError as e:
+            # Без сторінки обхід неповний: товари з неї не можна вважати проданими
+            logger.warning(str(e))
+            self.last_crawl_complete = False
+            return previous or PageSnapshot.construct(url=url)
+
+        if response.status == 304 and previous:
+            self.last_skipped_pages += 1
+            return previous
+        if response.status != 200:
+            logger.warning(f'Catalog page {url} responded with status {response.status}.')
+            self.last_crawl_complete = False
+            return previous or PageSnapshot.construct(url=url)
+        page_html = response.text
+        etag = response.etag
+        last_modified = response.last_modified
+
+        content_hash = hashlib.sha1(page_html.encode('utf-8')).hexdigest()
+        if previous and previous.content_hash == content_hash:
+            previous.etag = etag
+            previous.last_modified = last_modified
+            self.last_skipped_pages += 1
+            return previous
+
+        pagination_urls, products, product_hashes = await self.__extract_page(
+            page_html,
+            with_pagination=url == self.catalog_page,
+            previous=previous
+        )
+        return PageSnapshot.construct(
+            url=url,
+            etag=etag,
+            last_modified=last_modified,
+            content_hash=content_hash,
+            pagination_urls=pagination_urls,
+            products=products,
+            product_hashes=product_hashes
+        )
+
+    async def __extract_page(self,
+                             page_html: str,
+                             with_pagination: bool = False,
+                             previous: PageSnapshot | None = None) -> tuple[list[str], list[Product], list[str]]:
+        """ Парсинг і валідація виконуються в пулі процесів, щоб не блокувати event loop вебсервера.
+        Назад повертаються вже провалідовані записи, тому тут вони збираються через construct().
+        Товари з тим самим HTML-фрагментом, що й у попередньому знімку сторінки, беруться з нього без парсингу """
+        if self._executor is None and settings.parser_process_pool_size > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.parser_process_pool_size,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+        previous_products = dict(zip(previous.product_hashes, previous.products)) if previous else {}
+        args = (self.backend.name, self.bank_base_url, page_html, with_pagination, frozenset(previous_products))
+        if self._executor is None:
+            pagination_urls, records = extract_page(*args)
+        else:
+            loop = asyncio.get_running_loop()
+            pagination_urls, records = await loop.run_in_executor(self._executor, extract_page, *args)
+
+        products = []
+        product_hashes = []
+        for product_hash, record in records:
+            products.append(previous_products[product_hash] if record is None else Product.construct(**record))
+            product_hashes.append(product_hash)
+        self.last_reused_products += len(records) - sum(record is not None for _, record in records)
+        return pagination_urls, products, product_hashes
+
+    async def get_products_from_page(self, page_html: str) -> list[Product]:
+        _, products, _ = await self.__extract_page(page_html)
+        return products
+
+    async def iter_pages(self) -> AsyncIterator[PageSnapshot]:
+        """ Віддає сторінки каталогу по мірі завантаження: спочатку головну, далі сторінки пагінації
+        в порядку готовності. Одночасно в пам'яті тримається не більше parser_concurrency сторінок HTML """
+        start_time = time.monotonic()
+        self.last_skipped_pages = 0
+        self.last_reused_products = 0
+        self.last_crawl_complete = True
+        main_page = await self.__load_page(self.catalog_page)
+        page_snapshots = {}
+
+        if main_page.content_hash:
+            page_snapshots[main_page.url] = main_page
+
+        semaphore = asyncio.Semaphore(settings.parser_concurrency)
+
+        async def load_with_limit(url: str) -> PageSnapshot:
+            async with semaphore:
+                return await self.__load_page(url)
+
+        # Сторінки пагінації вантажаться, поки споживач обробляє головну сторінку
+        tasks = [asyncio.create_task(load_with_limit(url)) for url in main_page.pagination_urls]
+        try:
+            yield main_page
+            for next_page in asyncio.as_completed(tasks):
+                page = await next_page
+                if page.content_hash:
+                    page_snapshots[page.url] = page
+                yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Зберігаємо знімки тільки актуальних сторінок, щоб видалені сторінки пагінації не накопичувались
+        self.page_snapshots = page_snapshots
+        self.last_crawl_time = round(time.monotonic() - start_time, 2)
+        self.crawl_times.observe(self.last_crawl_time)
+        logger.info(f'Catalog crawl completed at {self.last_crawl_time} sec. Pages count: {len(tasks) + 1}. '
+                    f'Unchanged pages: {self.last_skipped_pages}. Reused products: {self.last_reused_products}')
+
+    async def iter_products(self) -> AsyncIterator[Product]:
+        async for page in self.iter_pages():
+            for product in page.products:
+                yield product
+
+    async def get_all(self) -> list[Product]:
+        return [product async for product in self.iter_products()]
+
+    async def probe(self) -> list[Product]:
+        """ Швидка перевірка лише "гарячих" сторінок каталогу, на яких першими з'являються нові товари """
+        urls = [f'{self.bank_base_url}{page}' for page in settings.parser_probe_pages]
+        pages = await asyncio.gather(*[self.__load_page(url) for url in urls])
+        for page in pages:
+            if page.content_hash:
+                self.page_snapshots[page.url] = page
+        return [product for page in pages for product in page.products]
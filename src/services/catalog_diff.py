@@ -0,0 +1,79 @@
+from typing import Iterable
+
+from src.schemas.mongo_collections import Product, ProductOut
+from src.schemas.parser import CatalogChangeSet, ProductChange
+
+
+_metadata_fields = ('name', 'url', 'image_url')
+
+
+class CatalogDiffer:
+    """ Інкрементально порівнює товари з каталогу сайту з товарами в базі за bank_product_id.
+    Товари додаються по мірі завантаження сторінок, а ті, яких немає серед відомих товарів бази,
+    чекають на resolve() з результатом дозапиту до бази """
+
+    def __init__(self, stored_products: Iterable[ProductOut]):
+        self.stored_by_id = {product.bank_product_id: product for product in stored_products}
+        self.change_set = CatalogChangeSet()
+        self.seen_ids: set[int] = set()
+        self._pending: dict[int, Product] = {}
+
+    def add(self, products: Iterable[Product]) -> list[int]:
+        """ Класифікує товари і повертає bank_product_id тих, яких немає серед відомих товарів бази """
+        unknown_ids = []
+        for product in products:
+            if product.bank_product_id in self.seen_ids:
+                continue
+            self.seen_ids.add(product.bank_product_id)
+
+            if product.bank_product_id in self.stored_by_id:
+                self.__classify(product)
+            else:
+                self._pending[product.bank_product_id] = product
+                unknown_ids.append(product.bank_product_id)
+        return unknown_ids
+
+    def resolve(self, stored_products: Iterable[ProductOut]) -> list[ProductChange]:
+        """ Доповнює відомі товари результатом дозапиту і повертає нові та знову доступні товари """
+        for product in stored_products:
+            self.stored_by_id[product.bank_product_id] = product
+
+        changes = []
+        for product in self._pending.values():
+            change = self.__classify(product)
+            if change is not None:
+                changes.append(change)
+        self._pending = {}
+        return changes
+
+    def finish(self) -> CatalogChangeSet:
+        self.resolve([])
+        for previous in self.stored_by_id.values():
+            if not previous.sold_out and previous.bank_product_id not in self.seen_ids:
+                self.change_set.sold_out.append(ProductChange.construct(product=previous, previous=previous))
+        return self.change_set
+
+    def __classify(self, product: Product) -> ProductChange | None:
+        previous = self.stored_by_id.get(product.bank_product_id)
+        if previous is None:
+            change = ProductChange.construct(product=product)
+            self.change_set.new.append(change)
+            return change
+
+        self.change_set.present_ids.append(previous.id)
+        change = ProductChange.construct(product=product, previous=previous)
+        if previous.sold_out:
+            self.change_set.restocked.append(change)
+            return change
+        if previous.price != product.price:
+            self.change_set.price_changed.append(change)
+        if any(getattr(previous, field) != getattr(product, field) for field in _metadata_fields):
+            self.change_set.metadata_changed.append(change)
+
+
+def diff_catalog(parsed_products: Iterable[Product], stored_products: Iterable[ProductOut]) -> CatalogChangeSet:
+    """ Порівнює товари з каталогу сайту з товарами в базі за bank_product_id за лінійний час.
+    stored_products мають містити всі товари з каталогу, які є в базі, а також усі товари в наявності """
+    differ = CatalogDiffer(stored_products)
+    differ.add(parsed_products)
+    return differ.finish()
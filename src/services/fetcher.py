@@ -0,0 +1,162 @@
+import asyncio
+import random
+import time
+from typing import Callable
+
+import aiohttp
+
+from src.config.settings import settings, logger
+from src.schemas.parser import FetchResponse
+from src.utils.histogram import LatencyHistogram
+
+
+class FetchError(Exception):
+    """ Сторінку не вдалось завантажити після всіх повторів """
+
+
+class CircuitOpenError(FetchError):
+    """ Сайт вважається недоступним, запити не виконуються до кінця cooldown """
+
+
+class CircuitBreaker:
+    """ Після threshold невдалих завантажень поспіль блокує запити на cooldown секунд.
+    Після cooldown пропускає запити знову: перший успіх закриває breaker, перша невдача - відкриває знову """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self) -> bool:
+        return self.state != 'open'
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            if self.state != 'open':
+                logger.warning(f'Catalog site looks down after {self.failures} failed pages. '
+                               f'Pause requests for {self.cooldown} sec.')
+            self.opened_at = time.monotonic()
+
+
+class PageFetcher:
+    """ Завантажує сторінки з таймаутом на запит, обмеженими експоненційними повторами і дублюючим
+    (hedged) запитом, якщо відповідь не прийшла за час перцентиля parser_hedge_percentile останніх запитів.
+    Повторюються лише мережеві помилки, таймаути та 5xx/429 - інші статуси повертаються як є """
+
+    retry_statuses = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, get_session: Callable[[], aiohttp.ClientSession]):
+        self.get_session = get_session
+        self.breaker = CircuitBreaker(settings.parser_breaker_threshold, settings.parser_breaker_cooldown)
+        self.latency = LatencyHistogram()
+        self.page_latency: dict[str, LatencyHistogram] = {}
+        self.requests = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    async def fetch(self, url: str, headers: dict[str, str] | None = None) -> FetchResponse:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'Circuit breaker is open. Skip {url}')
+
+        error: Exception | None = None
+        for attempt in range(settings.parser_retries + 1):
+            if attempt:
+                self.retries += 1
+                backoff = min(settings.parser_retry_backoff_max, settings.parser_retry_backoff * 2 ** (attempt - 1))
+                await asyncio.sleep(backoff * random.uniform(0.5, 1))
+            try:
+                response = await self.__hedged_get(url, headers or {})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                logger.warning(f'Catalog page {url} request failed (attempt {attempt + 1}): {e!r}')
+                continue
+            if response.status in self.retry_statuses:
+                error = FetchError(f'status {response.status}')
+                logger.warning(f'Catalog page {url} responded with status {response.status} (attempt {attempt + 1}).')
+                continue
+
+            self.breaker.record_success()
+            return response
+
+        self.failed += 1
+        self.breaker.record_failure()
+        raise FetchError(f'Catalog page {url} is unavailable: {error!r}')
+
+    async def __hedged_get(self, url: str, headers: dict[str, str]) -> FetchResponse:
+        primary = asyncio.create_task(self.__get(url, headers))
+        hedge_delay = self.__hedge_delay()
+        if hedge_delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self.hedged += 1
+                tasks.add(asyncio.create_task(self.__get(url, headers)))
+
+            error: BaseException | None = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def __hedge_delay(self) -> float | None:
+        if settings.parser_hedge_percentile <= 0 or len(self.latency.recent) < settings.parser_hedge_min_samples:
+            return
+        return self.latency.percentile(settings.parser_hedge_percentile)
+
+    async def __get(self, url: str, headers: dict[str, str]) -> FetchResponse:
+        self.requests += 1
+        start_time = time.monotonic()
+        timeout = aiohttp.ClientTimeout(total=settings.parser_request_timeout)
+        async with self.get_session().get(url, headers=headers, timeout=timeout) as response:
+            text = await response.text() if response.status == 200 else None
+            fetch_response = FetchResponse.construct(
+                url=url,
+                status=response.status,
+                text=text,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+
+        elapsed = time.monotonic() - start_time
+        self.latency.observe(elapsed)
+        self.page_latency.setdefault(url, LatencyHistogram(window=100)).observe(elapsed)
+        return fetch_response
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'failed': self.failed,
+            'breaker': self.breaker.state,
+            'latency': self.latency.to_dict(),
+            'page_latency': {url: histogram.to_dict() for url, histogram in self.page_latency.items()}
+        }
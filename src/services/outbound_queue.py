@@ -0,0 +1,188 @@
+import asyncio
+import datetime
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram.utils.exceptions import BadRequest, RetryAfter, Unauthorized
+
+from src.config.settings import settings, logger
+from src.crud.outbound_job import OutboundJobCRUD
+from src.schemas.mongo_collections import OutboundJob
+from src.utils.enums import JobKind, JobStatus
+from src.utils.histogram import LatencyHistogram
+
+JobHandler = Callable[..., Awaitable[Any]]
+
+# Менше значення - вища пріоритетність. Сповіщення про товари завжди йдуть попереду звітів
+JOB_PRIORITIES = {
+    JobKind.product_alert: 0,
+    JobKind.chat_message: 1,
+    JobKind.approve_payment: 1,
+    JobKind.image_preupload: 5,
+    JobKind.report: 9,
+}
+
+
+class OutboundQueue:
+    """ Черга вихідних повідомлень у Mongo (колекція outbound_jobs). Задачі переживають перезапуск застосунку,
+    виконуються пулом воркерів у порядку пріоритету, повторюються з експоненційною затримкою,
+    а після outbound_max_attempts спроб або постійної помилки Telegram переводяться в статус dead """
+
+    def __init__(self):
+        self.handlers: dict[JobKind, JobHandler] = {}
+        self.batching: dict[JobKind, tuple[int, str, float]] = {}
+        self.delivery_latency = LatencyHistogram()
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def handler(self, kind: JobKind) -> Callable[[JobHandler], JobHandler]:
+        """ Реєструє обробник задач kind. Обробник отримує payload задачі як іменовані аргументи """
+        def decorator(func: JobHandler) -> JobHandler:
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def batch_handler(self, kind: JobKind, size: int, key: str, window: float = 0
+                      ) -> Callable[[JobHandler], JobHandler]:
+        """ Реєструє обробник, який отримує список payload до size задач kind з однаковим payload[key].
+        Якщо задач менше, воркер чекає на інші до window секунд від створення першої задачі """
+        def decorator(func: JobHandler) -> JobHandler:
+            self.handlers[kind] = func
+            self.batching[kind] = (size, key, window)
+            return func
+        return decorator
+
+    async def enqueue(self, kind: JobKind, payload: dict[str, Any] | None = None, delay: float = 0):
+        await self.enqueue_many(kind, [payload or {}], delay)
+
+    async def enqueue_many(self, kind: JobKind, payloads: list[dict[str, Any]], delay: float = 0):
+        if not payloads:
+            return
+        dt_now = datetime.datetime.now(tz=settings.default_tz)
+        await OutboundJobCRUD.insert_many([
+            {
+                'kind': kind,
+                'payload': payload,
+                'priority': JOB_PRIORITIES[kind],
+                'status': JobStatus.pending,
+                'attempts': 0,
+                'run_at': dt_now + datetime.timedelta(seconds=delay),
+                'created': dt_now
+            }
+            for payload in payloads
+        ])
+        self._wakeup.set()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self.__work(n)) for n in range(settings.outbound_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def stats(self) -> dict:
+        return {
+            'workers': len(self._workers),
+            'jobs': await OutboundJobCRUD.count_by_status(),
+            'completed': self.completed,
+            'retried': self.retried,
+            'dead': self.dead,
+            'delivery_latency': self.delivery_latency.to_dict()
+        }
+
+    async def __work(self, number: int):
+        while True:
+            try:
+                job = await OutboundJobCRUD.claim(datetime.datetime.now(tz=settings.default_tz),
+                                                  settings.outbound_visibility_timeout)
+            except Exception as e:
+                logger.error(f'Outbound worker {number} failed to claim a job. Traceback: {e}')
+                job = None
+
+            if job is None:
+                # Нові задачі будять воркерів одразу, відкладені та з інших процесів - не пізніше poll_interval
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.outbound_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.__execute(job)
+            except Exception as e:
+                # Задача залишається в статусі processing і повернеться в чергу після visibility timeout
+                logger.error(f'Outbound worker {number} failed to process job {job.kind} {job.id}. Traceback: {e}')
+
+    async def __execute(self, job: OutboundJob):
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            await self.__dead_letter([job], f'No handler for job kind {job.kind}')
+            return
+
+        jobs = [job]
+        try:
+            if job.kind in self.batching:
+                await self.__claim_batch(job, jobs)
+                await handler([item.payload for item in jobs])
+            else:
+                await handler(**job.payload)
+        except RetryAfter as e:
+            await self.__retry(jobs, e, delay=e.timeout)
+        except (Unauthorized, BadRequest) as e:
+            # Бот заблокований, чат не існує або некоректний запит - повтор нічого не змінить
+            await self.__dead_letter(jobs, repr(e))
+        except Exception as e:
+            if job.attempts >= settings.outbound_max_attempts:
+                await self.__dead_letter(jobs, repr(e))
+            else:
+                await self.__retry(jobs, e)
+        else:
+            await OutboundJobCRUD.delete_many([item.id for item in jobs])
+            self.completed += len(jobs)
+            for item in jobs:
+                # Mongo повертає naive datetime в UTC
+                run_at = item.run_at if item.run_at.tzinfo else item.run_at.replace(tzinfo=datetime.timezone.utc)
+                self.delivery_latency.observe(time.time() - run_at.timestamp())
+
+    async def __claim_batch(self, job: OutboundJob, jobs: list[OutboundJob]):
+        """ Дописує в jobs захоплені задачі тієї ж серії, тож при помилці Mongo вони повторюються разом з job """
+        size, key, window = self.batching[job.kind]
+        filter = {'kind': job.kind, f'payload.{key}': job.payload.get(key)}
+        jobs += await OutboundJobCRUD.claim_many(filter, datetime.datetime.now(tz=settings.default_tz),
+                                                 settings.outbound_visibility_timeout, size - len(jobs))
+        created = job.created if job.created.tzinfo else job.created.replace(tzinfo=datetime.timezone.utc)
+        wait = window - (time.time() - created.timestamp())
+        if len(jobs) < size and wait > 0:
+            # Під час сплеску задачі вже лежать в черзі, тож чекає лише перша задача нової серії
+            await asyncio.sleep(wait)
+            jobs += await OutboundJobCRUD.claim_many(filter, datetime.datetime.now(tz=settings.default_tz),
+                                                     settings.outbound_visibility_timeout, size - len(jobs))
+
+    async def __retry(self, jobs: list[OutboundJob], error: Exception, delay: float | None = None):
+        job = jobs[0]
+        if delay is None:
+            delay = min(settings.outbound_retry_backoff_max, settings.outbound_retry_backoff * 2 ** (job.attempts - 1))
+            delay *= random.uniform(0.5, 1)
+        logger.warning(f'Outbound job {job.kind} {[item.id for item in jobs]} failed (attempt {job.attempts}): '
+                       f'{error!r}. Retry in {round(delay, 1)} sec.')
+        run_at = datetime.datetime.now(tz=settings.default_tz) + datetime.timedelta(seconds=delay)
+        await OutboundJobCRUD.reschedule([item.id for item in jobs], run_at, repr(error))
+        self.retried += len(jobs)
+
+    async def __dead_letter(self, jobs: list[OutboundJob], error: str):
+        job = jobs[0]
+        logger.error(f'Outbound job {job.kind} {[item.id for item in jobs]} moved to dead letters '
+                     f'after {job.attempts} attempts: {error}')
+        await OutboundJobCRUD.dead_letter([item.id for item in jobs], error)
+        self.dead += len(jobs)
+
+
+outbound_queue = OutboundQueue()
@@ -0,0 +1,282 @@
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from typing import Any
+
+import lxml.html
+from bs4 import BeautifulSoup, Tag
+from lxml import etree
+from pydantic import ValidationError
+
+from src.config.settings import logger
+from src.schemas.mongo_collections import Product
+from src.schemas.parser import ParsedPage
+
+
+def _has_class(class_name: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+
+def fragment_hash(fragment: bytes) -> str:
+    return hashlib.blake2b(fragment, digest_size=8).hexdigest()
+
+
+class ParserBackend(ABC):
+    """ Витягує пагінацію та сирі дані товарів з HTML сторінки каталогу """
+    name: str
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    @abstractmethod
+    def parse_page(self,
+                   page_html: str,
+                   with_pagination: bool = False,
+                   known_hashes: frozenset[str] = frozenset()) -> ParsedPage:
+        """ Товари, хеш HTML-фрагмента яких є в known_hashes, не парсяться - замість даних повертається None """
+        ...
+
+
+class SoupParserBackend(ParserBackend):
+    """ Початкова реалізація: повне дерево BeautifulSoup з html.parser. Залишена для порівняння """
+    name = 'html.parser'
+
+    def parse_page(self,
+                   page_html: str,
+                   with_pagination: bool = False,
+                   known_hashes: frozenset[str] = frozenset()) -> ParsedPage:
+        page_soup = BeautifulSoup(page_html, 'html.parser')
+        products_data, product_hashes = self.__get_products_data(page_soup, known_hashes)
+        return ParsedPage.construct(
+            pagination_urls=self.__get_pagination_urls(page_soup) if with_pagination else [],
+            products_data=products_data,
+            product_hashes=product_hashes
+        )
+
+    def __get_pagination_urls(self, main_page: BeautifulSoup) -> list[str]:
+        pagination_urls = []
+        try:
+            main_block = main_page.find('div', {'id': 'block'})
+            pagination = main_block.find('ul', {'class': 'pagination'})
+            if pagination:
+                pagination_items = pagination.find_all('a')
+                pagination_urls = list({f'{self.base_url}{item["href"]}' for item in pagination_items})
+        except AttributeError:
+            logger.error('Catalog page is unavailable. Main block with id=block not found.')
+
+        return pagination_urls
+
+    def __get_products_data(self,
+                            page_soup: BeautifulSoup,
+                            known_hashes: frozenset[str]) -> tuple[list[dict[str, Any] | None], list[str]]:
+        catalog_products = page_soup.find('div', {'class': 'row_catalog_products'})
+        if not catalog_products:
+            return [], []
+        items = catalog_products.find_all('div', {'class': 'product'})
+        # Обираємо тільки ті елементи, які є в наявності на сайті по класу "add2cart"
+        items = [item for item in items if item.select_one('.basked_product_bank .add2cart')]
+        product_hashes = [fragment_hash(str(item).encode('utf-8')) for item in items]
+        products_data = [
+            None if item_hash in known_hashes else self.__parse_product(item)
+            for item, item_hash in zip(items, product_hashes)
+        ]
+        return products_data, product_hashes
+
+    def __parse_product(self, product_tag: Tag) -> dict[str, Any]:
+        data = {}
+        try:
+            bank_product_id = product_tag.select_one('.basked_product_bank .add2cart')
+            data['bank_product_id'] = bank_product_id.get('data-id')
+
+            name_tag = product_tag.find('a', {'class': 'model_product'})
+            if name_tag:
+                name = name_tag.text.strip()
+                data['name'] = name
+
+            price_tag = product_tag.find('span', {'class': 'new_price'})
+            if price_tag:
+                price = re.search(r'^\d+', price_tag.text.replace(' ', ''))
+                if price:
+                    price = price.group(0)
+                    data['price'] = price
+
+            url_tag = product_tag.find('a', {'class': 'p_img_href'})
+            if url_tag:
+                url = f'{self.base_url}{url_tag["href"].lstrip("/")}'
+                data['url'] = url
+
+            image_url = product_tag.find('a', {'class': 'p_img_href'}).find('img')
+            if image_url:
+                image_url = image_url['data-src']
+                data['image_url'] = image_url
+
+            coin_params = product_tag.find('div', {'class': 'product_bank_parameters'}).find_all('p')
+            if coin_params:
+                if len(coin_params) == 3:
+                    data['material'] = coin_params[0].text
+                    data['circulation'] = coin_params[1].text
+                    data['year_of_production'] = coin_params[2].text
+        except Exception as e:
+            logger.error(f'Prseng error: {e}')
+
+        return data
+
+
+class LxmlParserBackend(ParserBackend):
+    """ Швидкий парсер на lxml: скомпільовані XPath-вирази одразу переходять до блоку
+    div.row_catalog_products, а поля товару збираються за один прохід по його піддереву """
+    name = 'lxml'
+
+    _catalog_xpath = etree.XPath(f'//div[{_has_class("row_catalog_products")}][1]')
+    _products_xpath = etree.XPath(f'./descendant::div[{_has_class("product")}]')
+    _pagination_xpath = etree.XPath(f'//div[@id="block"]//ul[{_has_class("pagination")}]//a/@href')
+    _main_block_xpath = etree.XPath('//div[@id="block"]')
+
+    def parse_page(self,
+                   page_html: str,
+                   with_pagination: bool = False,
+                   known_hashes: frozenset[str] = frozenset()) -> ParsedPage:
+        if not page_html or not page_html.strip():
+            logger.error('Catalog page is empty.')
+            return ParsedPage()
+
+        root = lxml.html.document_fromstring(page_html)
+        products_data, product_hashes = self.__get_products_data(root, known_hashes)
+        return ParsedPage.construct(
+            pagination_urls=self.__get_pagination_urls(root) if with_pagination else [],
+            products_data=products_data,
+            product_hashes=product_hashes
+        )
+
+    def __get_pagination_urls(self, root: etree.ElementBase) -> list[str]:
+        if not self._main_block_xpath(root):
+            logger.error('Catalog page is unavailable. Main block with id=block not found.')
+            return []
+        return list(dict.fromkeys(f'{self.base_url}{href}' for href in self._pagination_xpath(root)))
+
+    def __get_products_data(self,
+                            root: etree.ElementBase,
+                            known_hashes: frozenset[str]) -> tuple[list[dict[str, Any] | None], list[str]]:
+        catalog_products = self._catalog_xpath(root)
+        if not catalog_products:
+            return [], []
+
+        products_data = []
+        product_hashes = []
+        for product_tag in self._products_xpath(catalog_products[0]):
+            product_hash = fragment_hash(etree.tostring(product_tag, with_tail=False))
+            # Відомі хеші належать лише товарам, які були в наявності, тож повторно їх не парсимо
+            if product_hash in known_hashes:
+                products_data.append(None)
+                product_hashes.append(product_hash)
+                continue
+
+            data = self.__parse_product(product_tag)
+            # Обираємо тільки ті елементи, які є в наявності на сайті по класу "add2cart"
+            if data is not None:
+                products_data.append(data)
+                product_hashes.append(product_hash)
+        return products_data, product_hashes
+
+    def __parse_product(self, product_tag: etree.ElementBase) -> dict[str, Any] | None:
+        cart_tag = name_tag = price_tag = url_tag = params_tag = None
+        for element in product_tag.iterdescendants():
+            class_attr = element.get('class')
+            if not class_attr:
+                continue
+            class_names = class_attr.split()
+            if cart_tag is None and 'add2cart' in class_names and self.__in_basket_block(element, product_tag):
+                cart_tag = element
+            elif name_tag is None and element.tag == 'a' and 'model_product' in class_names:
+                name_tag = element
+            elif price_tag is None and element.tag == 'span' and 'new_price' in class_names:
+                price_tag = element
+            elif url_tag is None and element.tag == 'a' and 'p_img_href' in class_names:
+                url_tag = element
+            elif params_tag is None and element.tag == 'div' and 'product_bank_parameters' in class_names:
+                params_tag = element
+
+        if cart_tag is None:
+            return
+
+        data = {'bank_product_id': cart_tag.get('data-id')}
+        if name_tag is not None:
+            data['name'] = name_tag.text_content().strip()
+
+        if price_tag is not None:
+            price = re.search(r'^\d+', price_tag.text_content().replace(' ', ''))
+            if price:
+                data['price'] = price.group(0)
+
+        if url_tag is not None:
+            href = url_tag.get('href')
+            if href is not None:
+                data['url'] = f'{self.base_url}{href.lstrip("/")}'
+            image_tag = url_tag.find('.//img')
+            if image_tag is not None and image_tag.get('data-src'):
+                data['image_url'] = image_tag.get('data-src')
+
+        if params_tag is not None:
+            coin_params = params_tag.findall('.//p')
+            if len(coin_params) == 3:
+                data['material'] = coin_params[0].text_content()
+                data['circulation'] = coin_params[1].text_content()
+                data['year_of_production'] = coin_params[2].text_content()
+
+        return data
+
+    @staticmethod
+    def __in_basket_block(element: etree.ElementBase, product_tag: etree.ElementBase) -> bool:
+        for ancestor in element.iterancestors():
+            if ancestor is product_tag:
+                return False
+            if 'basked_product_bank' in (ancestor.get('class') or '').split():
+                return True
+        return False
+
+
+PARSER_BACKENDS: dict[str, type[ParserBackend]] = {
+    SoupParserBackend.name: SoupParserBackend,
+    LxmlParserBackend.name: LxmlParserBackend,
+}
+
+
+def get_parser_backend(name: str, base_url: str) -> ParserBackend:
+    try:
+        return PARSER_BACKENDS[name](base_url)
+    except KeyError:
+        raise ValueError(f'Unknown parser backend: {name}. Available: {", ".join(PARSER_BACKENDS)}')
+
+
+def validate_products(products_data: list[dict[str, Any]]) -> list[Product]:
+    products = []
+    for product_data in products_data:
+        try:
+            products.append(Product(**product_data))
+        except ValidationError as e:
+            error_data = e.errors()[0]
+            logger.error(f'Validation error. Field: {error_data.get("loc")}. '
+                         f'Message: {error_data.get("msg")}.\n'
+                         f'Product data: {product_data}')
+    return products
+
+
+def extract_page(backend_name: str,
+                 base_url: str,
+                 page_html: str,
+                 with_pagination: bool = False,
+                 known_hashes: frozenset[str] = frozenset()
+                 ) -> tuple[list[str], list[tuple[str, dict[str, Any] | None]]]:
+    """ Точка входу для процесу-воркера: парсить і валідує сторінку, повертаючи пари (хеш фрагмента, запис товару).
+    Записи передаються назад в event loop без повторної валідації. Для відомих хешів запис - None """
+    backend = get_parser_backend(backend_name, base_url)
+    parsed_page = backend.parse_page(page_html, with_pagination=with_pagination, known_hashes=known_hashes)
+    records = []
+    for product_hash, product_data in zip(parsed_page.product_hashes, parsed_page.products_data):
+        if product_data is None:
+            records.append((product_hash, None))
+            continue
+        products = validate_products([product_data])
+        if products:
+            records.append((product_hash, products[0].dict()))
+    return parsed_page.pagination_urls, records
@@ -1,182 +1,110 @@
 import datetime
-import re
-from typing import Any
 
-import aiohttp
-from bs4 import BeautifulSoup, Tag
-from pydantic import ValidationError
-from starlette.background import BackgroundTasks
-
-from src.bot import send_find_product_message
 from src.config.settings import settings, logger
 from src.crud.product import ProductCRUD
-from src.schemas.mongo_collections import Product, ProductUpdateFields
-
-
-class ProductParser:
-
-    def __init__(self):
-        self.bank_base_url = 'https://coins.bank.gov.ua/'
-        self.catalog_page = self.bank_base_url + 'catalog.html'
-
-    async def __get_page_text(self, url: str) -> str:
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                              'AppleWebKit/537.36 (KHTML, like Gecko) '
-                              'Chrome/89.0.4389.82 Safari/537.36'
-            }
-            async with session.get(url, headers=headers) as response:
-                result = await response.text()
-                return result
-
-    async def __scrap_page(self, url: str) -> BeautifulSoup:
-        catalog_page_html = await self.__get_page_text(url)
-        return BeautifulSoup(catalog_page_html, 'html.parser')
-
-    def __get_pagination_urls(self, main_page: BeautifulSoup) -> list:
-        pagination_urls = []
-        try:
-            main_block = main_page.find('div', {'id': 'block'})
-            pagination = main_block.find('ul', {'class': 'pagination'})
-            if pagination:
-                pagination_items = pagination.find_all('a')
-                pagination_urls = list({f'{self.bank_base_url}{item["href"]}' for item in pagination_items})
-        except AttributeError:
-            logger.error('Catalog page is unavailable. Main block with id=block not found.')
-
-        return pagination_urls
-
-    def __parse_product(self, product_tag: Tag) -> dict[str, Any]:
-        data = {}
-        try:
-            bank_product_id = product_tag.select_one('.basked_product_bank .add2cart')
-            data['bank_product_id'] = bank_product_id.get('data-id')
-
-            name_tag = product_tag.find('a', {'class': 'model_product'})
-            if name_tag:
-                name = name_tag.text.strip()
-                data['name'] = name
-
-            price_tag = product_tag.find('span', {'class': 'new_price'})
-            if price_tag:
-                price = re.search(r'^\d+', price_tag.text.replace(' ', ''))
-                if price:
-                    price = price.group(0)
-                    data['price'] = price
-
-            url_tag = product_tag.find('a', {'class': 'p_img_href'})
-            if url_tag:
-                url = f'{self.bank_base_url}{url_tag["href"].lstrip("/")}'
-                data['url'] = url
-
-            image_url = product_tag.find('a', {'class': 'p_img_href'}).find('img')
-            if image_url:
-                image_url = image_url['data-src']
-                data['image_url'] = image_url
-
-            coin_params = product_tag.find('div', {'class': 'product_bank_parameters'}).find_all('p')
-            if coin_params:
-                if len(coin_params) == 3:
-                    data['material'] = coin_params[0].text
-                    data['circulation'] = coin_params[1].text
-                    data['year_of_production'] = coin_params[2].text
-                else:
-                    pass
-                    # logger.info(f'Product {data["name"]} has problem with parsing params. '
-                    #             f'Coin_params: {coin_params}')
-        except Exception as e:
-            logger.error(f'Prseng error: {e}')
-
-        return data
-
-    async def get_products_from_page(self, page_scrap: BeautifulSoup) -> list[Product]:
-        catalog_products = page_scrap.find('div', {'class': 'row_catalog_products'})
-        if catalog_products:
-            items = catalog_products.find_all('div', {'class': 'product'})
-            # Обираємо тільки ті елементи, які є в наявності на сайті по класу "add2cart"
-            items = [item for item in items if item.select_one('.basked_product_bank .add2cart')]
-            products = []
-            for item in items:
-                product_data = self.__parse_product(item)
-                try:
-                    products.append(Product(**product_data))
-                except ValidationError as e:
-                    error_data = e.errors()[0]
-                    logger.error(f'Validation error. Field: {error_data.get("loc")}. '
-                                  f'Message: {error_data.get("msg")}.\n'
-                                  f'Product data: {product_data}')
-            return products
-
-    async def get_all(self):
-        main_page_soup = await self.__scrap_page(self.catalog_page)
-        pagination_urls = self.__get_pagination_urls(main_page_soup)
-        pages_soup = [main_page_soup]
-        for url in pagination_urls:
-            soup = await self.__scrap_page(url)
-            pages_soup.append(soup)
-
-        logger.info(f'Catalog page loaded. Pages count: {len(pages_soup)}')
-
-        products = []
-        for page in pages_soup:
-            parsed_products = await self.get_products_from_page(page)
-            products.extend(parsed_products)
-
-        return products
-
-
-async def __find_new_products(products: list[Product], found_products: list[Product]) -> list[Product]:
-    found_products_ids = [item.bank_product_id for item in found_products]
-    return [item for item in products if item.bank_product_id not in found_products_ids]
-
-
-async def parser_processing(background_tasks: BackgroundTasks):
+from src.crud.product_event import ProductEventCRUD
+from src.schemas.parser import CatalogChangeSet, ProductChange
+from src.services.catalog_crawler import ProductParser
+from src.services.catalog_diff import CatalogDiffer, diff_catalog
+from src.services.outbound_queue import outbound_queue
+from src.utils.enums import JobKind
+from src.utils.loop_monitor import LoopLagMonitor
+
+
+product_parser = ProductParser(settings.nbu_shop_base_url)
+
+
+async def enqueue_product_alerts(changes: list[ProductChange]):
+    """ Ставить у чергу сповіщення в канал про нові товари та товари, що знову в наявності.
+    Нові товари записуються в базу до сповіщень, щоб відправка могла зберегти в них image_file_id """
+    await ProductCRUD.insert_new([change.product for change in changes if change.previous is None])
+    await outbound_queue.enqueue_many(JobKind.product_alert, [
+        {'chat_id': settings.channel_id, 'product': change.product.dict(), 'is_new': change.previous is None}
+        for change in changes
+    ])
+    if settings.image_cache_chat_id:
+        await outbound_queue.enqueue_many(JobKind.image_preupload, [
+            {'bank_product_id': change.product.bank_product_id, 'image_url': change.product.image_url}
+            for change in changes if change.previous is None
+        ])
+
+
+async def parser_processing() -> CatalogChangeSet:
+    if not product_parser.fetcher.breaker.allow():
+        logger.warning('Catalog site is unavailable. Skip parser run until circuit breaker cooldown ends.')
+        return CatalogChangeSet()
+
     dt_now = datetime.datetime.now(tz=settings.default_tz)
-    parser = ProductParser()
-    products = await parser.get_all()
-    logger.info(f'Product count ready to buy: {len(products)}')
-    product_ids = [product.bank_product_id for product in products]
+    # Всі товари в наявності потрібні, щоб визначити ті, що зникли з сайту. Решту товарів з бази
+    # дозапитуємо посторінково лише для невідомих bank_product_id
+    stored_products = await ProductCRUD.get_many(filter={'sold_out': False})
+    differ = CatalogDiffer(stored_products)
+
+    async with LoopLagMonitor() as loop_monitor:
+        async for page in product_parser.iter_pages():
+            unknown_ids = differ.add(page.products)
+            if not unknown_ids:
+                continue
+            stored_products = await ProductCRUD.get_many(filter={'bank_product_id': {'$in': unknown_ids}})
+            changes = differ.resolve(stored_products)
+            for change in changes:
+                if change.previous is None:
+                    logger.info('Added new product %s' % change.product.name)
+            # Якщо товар є в каталозі сайту, а в базі він sold_out=True - відправляємо сповіщення в бот.
+            # Сповіщення йдуть у чергу одразу, не чекаючи кінця обходу
+            await enqueue_product_alerts(changes)
+
+    product_parser.last_loop_blocked_time = round(loop_monitor.blocked_time, 3)
+    logger.info(f'Event loop was blocked for {product_parser.last_loop_blocked_time} sec. during crawl '
+                f'(max lag {round(loop_monitor.max_lag, 3)} sec.)')
+    logger.info(f'Product count ready to buy: {len(differ.seen_ids)}')
+    change_set = differ.finish()
+
+    if not product_parser.last_crawl_complete:
+        if change_set.sold_out:
+            logger.warning(f'Catalog crawl is incomplete. '
+                           f'Skip marking {len(change_set.sold_out)} products as sold out.')
+        change_set.sold_out = []
+    else:
+        missing_count = len(change_set.sold_out)
+        change_set.sold_out = product_parser.confirm_sold_out(change_set.sold_out)
+        if missing_count > len(change_set.sold_out):
+            logger.info(f'{missing_count - len(change_set.sold_out)} products are missing from the catalog. '
+                        f'Wait for the next crawls before marking them as sold out.')
+
+    # Товари, які були в наявності, але зникли з каталогу, позначаються sold_out в тому ж bulk_write
+    summary = await ProductCRUD.bulk_persist(change_set, dt_now)
+    logger.info(f'Catalog persisted: {summary}')
+    events_count = await ProductEventCRUD.append_from_change_set(change_set, dt_now)
+    logger.info(f'Product events recorded: {events_count}')
+    product_parser.known_ids = differ.seen_ids
+    return change_set
+
+
+async def probe_processing() -> CatalogChangeSet:
+    """ Перевіряє гарячі сторінки і одразу сповіщає про нові товари та товари, що знову в наявності.
+    Статус sold_out тут не змінюється - це робить лише повний обхід каталогу """
+    if not product_parser.fetcher.breaker.allow():
+        return CatalogChangeSet()
 
-    found_products = await ProductCRUD.get_many(
-        filter={'bank_product_id': {'$in': product_ids}}
-    )
+    dt_now = datetime.datetime.now(tz=settings.default_tz)
+    products = await product_parser.probe()
+    unknown_products = [product for product in products if product.bank_product_id not in product_parser.known_ids]
+    if not unknown_products:
+        return CatalogChangeSet()
 
-    new_products = await __find_new_products(products, found_products)
-
-    for product in new_products:
-        logger.info('Added new product %s' % product.name)
-        await ProductCRUD.insert_one(product)
-        background_tasks.add_task(send_find_product_message, settings.channel_id, product, True)
-
-    for product in found_products:
-        update_params = ProductUpdateFields(
-            updated=dt_now
-        )
-        # Якщо товар є в каталозі сайту, а в базі він sold_out=True - змінюємо його статус
-        # і відправляємо сповіщення в бот
-        if product.sold_out:
-            try:
-                parsed_product = [item for item in products if item.bank_product_id == product.bank_product_id][0]
-                update_params.name = parsed_product.name
-                update_params.price = parsed_product.price
-                update_params.url = parsed_product.url
-                update_params.image_url = parsed_product.image_url
-            except Exception as e:
-                logger.error(f'Error when select product by product_id: Traceback: {e}')
-            update_params.available_from = dt_now
-            update_params.sold_out = False
-
-            background_tasks.add_task(send_find_product_message, settings.channel_id, product, False)
-
-        await ProductCRUD.update_one(
-            product_id=product.id,
-            update_fields=update_params
-        )
-
-    # Знаходимо товари, які не оновлювались протягом часу, зазначеного в змінній _check_product_age
-    _check_product_age = 5
-    await ProductCRUD.update_many(
-        {'updated': {'$lt': dt_now - datetime.timedelta(minutes=_check_product_age)}},
-        ProductUpdateFields(updated=dt_now, sold_out=True)
+    stored_products = await ProductCRUD.get_many(
+        filter={'bank_product_id': {'$in': [product.bank_product_id for product in unknown_products]}}
     )
+    change_set = diff_catalog(unknown_products, stored_products)
+
+    for change in change_set.new:
+        logger.info('Probe found new product %s' % change.product.name)
+    await enqueue_product_alerts(change_set.new + change_set.restocked)
+
+    if change_set.has_changes:
+        summary = await ProductCRUD.bulk_persist(change_set, dt_now)
+        logger.info(f'Probe persisted: {summary}')
+        await ProductEventCRUD.append_from_change_set(change_set, dt_now)
+    product_parser.known_ids.update(product.bank_product_id for product in unknown_products)
+    return change_set
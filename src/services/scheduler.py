@@ -0,0 +1,90 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+
+from src.config.settings import settings, logger
+from src.schemas.parser import CatalogChangeSet
+from src.services.product_parser import parser_processing, probe_processing
+
+
+class ParserScheduler:
+    """ Періодично запускає парсер. Одночасно може виконуватись лише один запуск, а інтервал
+    скорочується після запусків зі змінами в каталозі і поступово збільшується, коли змін немає.
+    Між повними обходами окремо з інтервалом parser_probe_interval перевіряються гарячі сторінки """
+
+    def __init__(self):
+        self.interval = settings.parser_interval
+        self.last_run_at: float | None = None
+        self.last_run_time: float | None = None
+        self._lock = asyncio.Lock()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks.append(asyncio.create_task(self.__run_forever()))
+            if settings.parser_probe_interval > 0:
+                self._tasks.append(asyncio.create_task(self.__probe_forever()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_once(self) -> CatalogChangeSet | None:
+        start_time = time.monotonic()
+        change_set = await self.__run_single_flight(parser_processing)
+        if change_set is None:
+            return
+
+        self.last_run_at = time.time()
+        self.last_run_time = round(time.monotonic() - start_time, 2)
+        self.__adapt_interval(change_set.has_changes)
+        logger.info(f'Parser finished at {self.last_run_time} sec. Next interval: {round(self.interval, 1)} sec.')
+        return change_set
+
+    async def probe_once(self) -> CatalogChangeSet | None:
+        return await self.__run_single_flight(probe_processing)
+
+    async def __run_single_flight(self,
+                                  processing: Callable[[], Awaitable[CatalogChangeSet]]) -> CatalogChangeSet | None:
+        if self._lock.locked():
+            logger.info('Parser is already running. Skip this run.')
+            return
+
+        async with self._lock:
+            return await processing()
+
+    def __adapt_interval(self, has_changes: bool):
+        if has_changes:
+            self.interval = max(settings.parser_min_interval, self.interval / 2)
+        else:
+            self.interval = min(settings.parser_max_interval, self.interval * 1.25)
+
+    def __next_delay(self) -> float:
+        jitter = self.interval * settings.parser_interval_jitter
+        return max(0.0, self.interval + random.uniform(-jitter, jitter))
+
+    async def __run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f'Error in scheduled parser run. Traceback: {e}')
+            await asyncio.sleep(self.__next_delay())
+
+    async def __probe_forever(self):
+        while True:
+            await asyncio.sleep(settings.parser_probe_interval)
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.error(f'Error in hot pages probe. Traceback: {e}')
+
+
+parser_scheduler = ParserScheduler()
@@ -0,0 +1,55 @@
+import datetime
+from collections import OrderedDict
+
+from src.config.settings import settings, logger
+from src.crud.processed_update import ProcessedUpdateCRUD
+
+
+class UpdateDeduplicator:
+    """ Відкидає повторні доставки оновлень від Telegram за update_id до запуску обробників.
+    Останні update_id зберігаються в LRU обмеженого розміру, а за update_dedup_mongo - ще й у колекції
+    processed_updates з TTL-індексом, щоб дублікати відкидались і між процесами """
+
+    def __init__(self, max_size: int, use_mongo: bool = False):
+        self.max_size = max_size
+        self.use_mongo = use_mongo
+        self.dropped = 0
+        self._seen: OrderedDict[int, None] = OrderedDict()
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return self.__drop(update_id)
+
+        self._seen[update_id] = None
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+        if self.use_mongo:
+            try:
+                is_new = await ProcessedUpdateCRUD.insert_if_new(
+                    update_id,
+                    datetime.datetime.now(tz=settings.default_tz)
+                )
+            except Exception as e:
+                # Без Mongo покладаємось лише на LRU, ніж втратити оновлення
+                logger.error(f'Failed to check update {update_id} for duplicates. Traceback: {e}')
+                return False
+            if not is_new:
+                return self.__drop(update_id)
+        return False
+
+    def __drop(self, update_id: int) -> bool:
+        self.dropped += 1
+        logger.info(f'Drop duplicate update {update_id}.')
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'dropped_duplicates': self.dropped,
+            'tracked': len(self._seen),
+            'mongo': self.use_mongo
+        }
+
+
+update_deduplicator = UpdateDeduplicator(settings.update_dedup_size, settings.update_dedup_mongo)
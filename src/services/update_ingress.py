@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.webhook import BaseResponse
+from aiogram.utils.exceptions import TelegramAPIError
+
+from src.bot import bot, dp
+from src.config.settings import settings, logger
+from src.utils.histogram import LatencyHistogram
+
+
+def update_chat_key(update: types.Update) -> int:
+    """ Ключ, за яким оновлення розподіляються по воркерах: чат повідомлення або користувач """
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message:
+        return message.chat.id
+    for event in (update.callback_query, update.chat_join_request, update.inline_query, update.my_chat_member,
+                  update.chat_member, update.pre_checkout_query, update.shipping_query):
+        if event and event.from_user:
+            return event.from_user.id
+    return update.update_id
+
+
+class UpdateIngress:
+    """ Приймає оновлення з webhook без очікування обробки. Оновлення розкладаються по update_workers чергах
+    за chat_id: різні чати обробляються паралельно, а оновлення одного чату - строго по черзі.
+    Якщо обробник повернув рівно одну відповідь (BaseResponse) і webhook ще чекає, вона віддається
+    в тілі відповіді на webhook. Інакше воркер відправляє її сам """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.queues: list[asyncio.Queue] = []
+        self.lag = LatencyHistogram()
+        self.processing_time = LatencyHistogram()
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        self.inline_replies = 0
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        if not self._workers:
+            self.queues = [asyncio.Queue(maxsize=settings.update_queue_size) for _ in range(settings.update_workers)]
+            self._workers = [asyncio.create_task(self.__work(queue)) for queue in self.queues]
+
+    async def stop(self):
+        try:
+            await asyncio.wait_for(asyncio.gather(*[queue.join() for queue in self.queues]),
+                                   timeout=settings.update_drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'Stop update workers with {self.depth} unprocessed updates.')
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, update: types.Update) -> asyncio.Future:
+        """ Future отримає відповідь обробника для webhook, якщо вона одна, або None """
+        self.received += 1
+        reply = asyncio.get_running_loop().create_future()
+        queue = self.queues[update_chat_key(update) % len(self.queues)]
+        await queue.put((time.monotonic(), update, reply))
+        return reply
+
+    async def wait_reply(self, reply: asyncio.Future) -> dict | None:
+        """ Чекає на відповідь обробника не довше update_inline_reply_timeout. Повертає тіло відповіді
+        на webhook з викликом методу Bot API, або None, якщо відповідати нічого або вже пізно """
+        if settings.update_inline_reply_timeout > 0:
+            try:
+                response = await asyncio.wait_for(asyncio.shield(reply), settings.update_inline_reply_timeout)
+            except asyncio.TimeoutError:
+                # Якщо воркер не встиг - відповідь він відправить сам
+                if reply.cancel():
+                    return
+                response = reply.result()
+            if response is not None:
+                self.inline_replies += 1
+                return response.get_response()
+        reply.cancel()
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self._workers),
+            'depth': self.depth,
+            'max_queue_depth': max((queue.qsize() for queue in self.queues), default=0),
+            'received': self.received,
+            'processed': self.processed,
+            'errors': self.errors,
+            'inline_replies': self.inline_replies,
+            'lag': self.lag.to_dict(),
+            'processing_time': self.processing_time.to_dict()
+        }
+
+    async def __work(self, queue: asyncio.Queue):
+        Dispatcher.set_current(self.dispatcher)
+        Bot.set_current(self.bot)
+        while True:
+            received_at, update, reply = await queue.get()
+            start_time = time.monotonic()
+            self.lag.observe(start_time - received_at)
+            try:
+                results = await self.dispatcher.process_update(update)
+                responses = [result for result in results or [] if isinstance(result, BaseResponse)]
+                if len(responses) == 1 and not reply.done():
+                    reply.set_result(responses[0])
+                else:
+                    if not reply.done():
+                        reply.set_result(None)
+                    await self.__execute_responses(responses)
+                self.processed += 1
+            except Exception as e:
+                if not reply.done():
+                    reply.set_result(None)
+                self.errors += 1
+                logger.error(f'Error while processing update {update.update_id}. Traceback: {e}')
+            finally:
+                self.processing_time.observe(time.monotonic() - start_time)
+                queue.task_done()
+
+    async def __execute_responses(self, responses: list[BaseResponse]):
+        for response in responses:
+            try:
+                await response.execute_response(self.bot)
+            except TelegramAPIError as e:
+                logger.warning(f'Failed to send {response.method} reply. Traceback: {e}')
+
+
+update_ingress = UpdateIngress(dp, bot)
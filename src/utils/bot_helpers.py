@@ -3,7 +3,7 @@ import datetime
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, BotCommand
 
 from src.config.settings import settings, logger
-from src.schemas.mongo_collections import Product
+from src.schemas.mongo_collections import Product, ProductEventOut
 from src.schemas.bot import MessageModel
 
 
@@ -113,6 +113,33 @@ def find_product_message(product: Product, is_new: bool = True) -> MessageModel:
     return MessageModel(text=text, keyboard=kb_markup)
 
 
+def find_products_album_message(products: list[Product], is_new: list[bool]) -> tuple[str, MessageModel]:
+    """ Підпис до альбому з товарами і наступне повідомлення з кнопками-посиланнями,
+    бо до альбому не можна додати клавіатуру """
+    if all(is_new):
+        title = 'З\'явились нові товари на сайті!'
+    elif not any(is_new):
+        title = 'Товари знову у продажі!'
+    else:
+        title = 'Нові товари та товари, що знову у продажі!'
+
+    caption = f'<b>{title}</b>\n'
+    for n, (product, product_is_new) in enumerate(zip(products, is_new), start=1):
+        line = f'\n{n}. {product.name} - {product.price} грн.'
+        if not product_is_new and any(is_new):
+            line += ' (знову у продажі)'
+        # Підпис до фото в Telegram обмежений 1024 символами
+        if len(caption) + len(line) > 1024:
+            break
+        caption += line
+
+    kb_markup = InlineKeyboardMarkup(row_width=1)
+    for n, product in enumerate(products, start=1):
+        kb_markup.add(InlineKeyboardButton(text=f'{n}. {product.name}'[:64], url=product.url))
+
+    return caption, MessageModel(text='Переглянути товари на сайті:', keyboard=kb_markup)
+
+
 def get_join_command_message(has_subscribe: bool, invite_link: str | None = None) -> MessageModel:
     if has_subscribe:
         _invite_button_text = 'Приєднатись'
@@ -189,11 +216,14 @@ def get_chat_join_request_message(is_approved: bool) -> MessageModel:
     return MessageModel(text=text)
 
 
-def report_notification_message(new_products: list[Product]) -> MessageModel:
+def report_notification_message(new_products: list[ProductEventOut],
+                                restocked_products: list[ProductEventOut]) -> MessageModel:
     text = f'Надсилаю Вам щоденний звіт по оновленням інтернет магазину.\n'
     if not new_products:
         text += f'Сьогодні нових товарів в інтернет магазині не надходило.'
     else:
         text += f'Сьогодні було додано нових товарів {len(new_products)} шт.'
+    if restocked_products:
+        text += f'\nЗнову з\'явились в наявності {len(restocked_products)} шт.'
 
     return MessageModel(text=text)
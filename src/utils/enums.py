@@ -4,4 +4,25 @@ from enum import Enum
 class ExpireDateAction(str, Enum):
     add = 'add'
     subtract = 'subtract'
-    
\ No newline at end of file
+
+
+class ChangeType(str, Enum):
+    new = 'new'
+    restocked = 'restocked'
+    sold_out = 'sold_out'
+    price_changed = 'price_changed'
+    metadata_changed = 'metadata_changed'
+
+
+class JobKind(str, Enum):
+    product_alert = 'product_alert'
+    chat_message = 'chat_message'
+    approve_payment = 'approve_payment'
+    report = 'report'
+    image_preupload = 'image_preupload'
+
+
+class JobStatus(str, Enum):
+    pending = 'pending'
+    processing = 'processing'
+    dead = 'dead'
@@ -4,12 +4,25 @@ from monthdelta import monthdelta
 
 from src.config.settings import settings
 from src.crud.client import ClientCRUD
-from src.schemas.mongo_collections import ClientUpdateFields, ClientOut
+from src.schemas.mongo_collections import ClientUpdateFields, ClientOut, ClientSubscription
 from src.utils.enums import ExpireDateAction
+from src.utils.ttl_cache import TTLCache
+
+subscription_cache = TTLCache(settings.subscription_cache_ttl, settings.subscription_cache_size)
+
+
+async def get_client_subscription(chat_id: int) -> ClientSubscription | None:
+    """ Статус підписки за chat_id: з кешу процесу або легким запитом до бази """
+    subscription = subscription_cache.get(chat_id)
+    if subscription is None:
+        subscription = await ClientCRUD.get_subscription(chat_id=chat_id)
+        if subscription:
+            subscription_cache.set(chat_id, subscription)
+    return subscription
 
 
 async def update_client_expire_date(client_id: str, action: ExpireDateAction):
-    client = await ClientCRUD.get_one(id=client_id)
+    client = await ClientCRUD.get_subscription(id=client_id)
     if client:
         if action == 'add':
             new_expire_date = datetime.datetime.now(tz=settings.default_tz) + monthdelta(1)
@@ -17,8 +30,10 @@ async def update_client_expire_date(client_id: str, action: ExpireDateAction):
             new_expire_date = client.expired_at - monthdelta(1)
 
         await ClientCRUD.update_one(client_id, ClientUpdateFields(expired_at=new_expire_date))
+        # Запит на вступ до каналу зазвичай приходить одразу після оплати - кладемо в кеш вже оновлену підписку
+        subscription_cache.set(client.chat_id, client.copy(update={'expired_at': new_expire_date}))
 
 
-def client_has_active_sub(client: ClientOut):
+def client_has_active_sub(client: ClientOut | ClientSubscription):
     # Return True if subscribe is active
     return client.expired_at.timestamp() > datetime.datetime.now(tz=settings.default_tz).timestamp()
@@ -0,0 +1,38 @@
+import bisect
+from collections import deque
+
+
+class LatencyHistogram:
+    """ Гістограма затримок з фіксованими межами кошиків (в секундах) і вікном останніх вимірів для перцентилів """
+
+    default_bounds = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, bounds: tuple[float, ...] = default_bounds, window: int = 500):
+        self.bounds = bounds
+        # Останній кошик - для значень більших за найбільшу межу
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.recent: deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.recent:
+            return
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    def to_dict(self) -> dict:
+        buckets = {f'le_{bound}': count for bound, count in zip(self.bounds, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        return {
+            'count': self.total,
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p95': round(p95, 3) if p95 is not None else None,
+            'p99': round(p99, 3) if p99 is not None else None,
+            'buckets': buckets
+        }
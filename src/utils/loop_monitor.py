@@ -0,0 +1,33 @@
+import asyncio
+
+
+class LoopLagMonitor:
+    """ Вимірює, наскільки довго event loop був заблокований під час виконання блоку коду.
+    Фонова задача засинає на interval секунд і рахує запізнення пробудження """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.blocked_time = 0.0
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self.__watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def __watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > 0:
+                self.blocked_time += lag
+                self.max_lag = max(self.max_lag, lag)